@@ -1,19 +1,6 @@
 import base64
 import os
-import glob
 from dotenv import load_dotenv
-
-# ... (existing imports)
-
-def main():
-    # ... (existing code)
-
-    for pdf_path in pdf_files:
-        file_name = os.path.basename(pdf_path)
-        # Azure Searchのキーとして使用するためにBase64エンコード（URLセーフ）
-        doc_id = base64.urlsafe_b64encode(file_name.encode("utf-8")).decode("utf-8")
-        
-        print(f"\nProcessing: {file_name}")
 from openai import AzureOpenAI
 import re
 from azure.core.credentials import AzureKeyCredential
@@ -22,9 +9,14 @@ from content_understanding_client import ContentUnderstandingClient
 
 # 環境変数の読み込み（ルートディレクトリの.envを参照）
 import pathlib
+import sys
 ROOT_DIR = pathlib.Path(__file__).parent.parent
 load_dotenv(ROOT_DIR / ".env")
 
+# ルートディレクトリをパスに追加（共通のレート制限を使用するため）
+sys.path.insert(0, str(ROOT_DIR))
+from rate_limiter import Priority, estimate_tokens, get_scheduler
+
 # 設定値の取得
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_API_ENDPOINT")
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
@@ -34,7 +26,9 @@ AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
 AZURE_SEARCH_API_KEY = os.getenv("AZURE_SEARCH_API_KEY")
 
 INDEX_NAME = "vector-sample-index"
-PDF_DIR = "files" # PDFファイルが置いてあるディレクトリ
+PDF_DIR = str(pathlib.Path(__file__).parent / "files") # PDFファイルが置いてあるディレクトリ（実行場所によらずこのスクリプトからの相対パス）
+# 1回のアップロードで送信するドキュメント数（ベクトルを含むためリクエストサイズの上限に注意）
+UPLOAD_BATCH_SIZE = 100
 
 def chunk_markdown_by_headers(markdown_text):
     """
@@ -58,6 +52,184 @@ def chunk_markdown_by_headers(markdown_text):
         
     return [c for c in chunks if c] # 空のチャンクを除外
 
+# Content Understandingがサポートする拡張子（例）
+SUPPORTED_EXTENSIONS = ['.pdf', '.png', '.jpg', '.jpeg', '.tiff', '.docx', '.xlsx', '.pptx', '.html']
+
+def discover_files(directory=PDF_DIR, recursive=True, extensions=None, min_bytes=1, max_bytes=None):
+    """
+    ディレクトリ内の解析対象ファイルを順に返すジェネレータ。
+    サブディレクトリも辿り（隠しディレクトリとシンボリックリンクは除く）、
+    拡張子とファイルサイズで絞り込みます。
+    """
+    extensions = tuple(e.lower() for e in (extensions or SUPPORTED_EXTENSIONS))
+    try:
+        entries = sorted(os.scandir(directory), key=lambda e: e.name)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if recursive:
+                yield from discover_files(entry.path, recursive, extensions, min_bytes, max_bytes)
+            continue
+        if not entry.is_file() or not entry.name.lower().endswith(extensions):
+            continue
+        size = entry.stat().st_size
+        if size < min_bytes or (max_bytes is not None and size > max_bytes):
+            continue
+        yield entry.path
+
+def make_doc_id(file_name):
+    """
+    Azure Searchのキーとして使用するためにファイル名をBase64エンコード（URLセーフ）します。
+    """
+    return base64.urlsafe_b64encode(file_name.encode("utf-8")).decode("utf-8")
+
+def is_indexed(search_client, file_name, scheduler=None):
+    """
+    同名ファイルが既にインデックスに存在するか確認します。
+    """
+    scheduler = scheduler or get_scheduler()
+    try:
+        def search():
+            escaped = file_name.replace("'", "''")
+            results = search_client.search(search_text="*", filter=f"file_name eq '{escaped}'", top=1)
+            return any(results)
+        return scheduler.call("search", search, priority=Priority.BULK)
+    except Exception as e:
+        print(f"検索エラー (スキップ確認中): {e}")
+        return False
+
+def analyze_and_chunk(cu_client, file_path, file_name=None):
+    """
+    Content Understandingでファイルを解析し、チャンク単位のドキュメントを順に返すジェネレータ。
+    大きなPDFはページ範囲ごとに解析し、範囲をまたいで chunk_no を連番にします。
+    解析済みの範囲のチャンクから順に返すため、文書全体のチャンクをメモリに保持しません。
+    file_name を省略した場合はファイル名（パスを除く）を使用します。
+    """
+    file_name = file_name or os.path.basename(file_path)
+    doc_id = make_doc_id(file_name)
+
+    chunk_no = 0
+    # Content Understandingで解析し、Markdownをチャンク分割
+    for markdown_content in cu_client.iter_analyze_file(file_path):
+        for chunk_content in chunk_markdown_by_headers(markdown_content or ""):
+            # ドキュメントオブジェクト作成
+            yield {
+                "id": f"{doc_id}_{chunk_no}",
+                "content": chunk_content,
+                "file_name": file_name,
+                "file_id": doc_id,
+                "chunk_no": chunk_no
+            }
+            chunk_no += 1
+
+    # 解析結果が空でないか確認
+    if chunk_no == 0:
+        print(f"スキップ: 解析結果が空でした ({file_name})")
+    else:
+        print(f"  - {chunk_no} チャンクに分割されました")
+
+def embed_documents(openai_client, documents, model=None, scheduler=None):
+    """
+    各ドキュメントをベクトル化し、content_vector に格納します。
+    スロットリングはスケジューラが再試行し、それでも失敗したドキュメントには
+    content_vector が設定されません。
+    """
+    model = model or AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+    scheduler = scheduler or get_scheduler()
+    for doc in documents:
+        try:
+            # Embeddingモデルのトークン制限（8191トークンなど）に注意が必要
+            # 長い場合は切り詰めるかチャンク分割が必要
+            # ここでは簡易的に先頭文字で制限
+            content_to_embed = doc["content"][:8000] 
+            
+            response = scheduler.call(
+                "embeddings",
+                openai_client.embeddings.create,
+                input=content_to_embed,
+                model=model,
+                tokens=estimate_tokens(content_to_embed),
+                priority=Priority.BULK,
+            )
+            doc["content_vector"] = response.data[0].embedding
+            
+        except Exception as e:
+            print(f"ベクトル化エラー (ID: {doc['id']}): {e}")
+
+def upload_documents(search_client, documents, scheduler=None, batch_size=UPLOAD_BATCH_SIZE):
+    """
+    ベクトル化済みのドキュメントを batch_size 件ずつアップロードし、成功件数を返します。
+    """
+    scheduler = scheduler or get_scheduler()
+    # ベクトル化に失敗して content_vector がないドキュメントを除外
+    valid_docs = [d for d in documents if "content_vector" in d]
+    if not valid_docs:
+        print("アップロード可能なドキュメントがありません。")
+        return 0
+    uploaded = 0
+    for start in range(0, len(valid_docs), batch_size):
+        batch = valid_docs[start:start + batch_size]
+        result = scheduler.call("search", search_client.upload_documents, documents=batch, priority=Priority.BULK)
+        uploaded += len(result)
+    print(f"\nドキュメントアップロード結果: {uploaded} 件成功")
+    return uploaded
+
+def delete_documents(search_client, doc_ids, scheduler=None, batch_size=1000):
+    """
+    指定したIDのドキュメントをインデックスから削除します。
+    """
+    scheduler = scheduler or get_scheduler()
+    for start in range(0, len(doc_ids), batch_size):
+        batch = [{"id": doc_id} for doc_id in doc_ids[start:start + batch_size]]
+        scheduler.call("search", search_client.delete_documents, documents=batch, priority=Priority.BULK)
+
+def ingest_file(cu_client, openai_client, search_client, file_path, file_name=None,
+                batch_size=UPLOAD_BATCH_SIZE, require_all=False):
+    """
+    1ファイルを解析し、チャンクが batch_size 件たまるごとにベクトル化してアップロードします。
+    保持するのは解析中の範囲と1バッチ分のチャンクだけのため、文書の大きさによらずメモリ使用量は一定です。
+
+    途中で解析やアップロードに失敗した場合は、このファイルのアップロード済みのチャンクを削除してから
+    例外を送出します（一部だけ登録されたファイルが登録済みとして扱われるのを防ぐため）。
+    require_all=True の場合は、ベクトル化に失敗したチャンクがあるときも同様に削除して失敗とします。
+
+    Returns:
+        tuple[int, int]: (チャンク数, アップロード件数)
+    """
+    uploaded_ids = []
+    chunks = 0
+    uploaded = 0
+    batch = []
+
+    def flush():
+        nonlocal uploaded
+        embed_documents(openai_client, batch)
+        failed = [d["id"] for d in batch if "content_vector" not in d]
+        if failed and require_all:
+            raise RuntimeError(f"{len(failed)} 件のチャンクのベクトル化に失敗しました")
+        if len(failed) < len(batch):
+            uploaded += upload_documents(search_client, batch)
+            uploaded_ids.extend(d["id"] for d in batch if "content_vector" in d)
+        batch.clear()
+
+    try:
+        for document in analyze_and_chunk(cu_client, file_path, file_name):
+            chunks += 1
+            batch.append(document)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except Exception:
+        if uploaded_ids:
+            print(f"  - 失敗したため、登録済みの {len(uploaded_ids)} チャンクを削除します")
+            delete_documents(search_client, uploaded_ids)
+        raise
+    return chunks, uploaded
+
 def main():
     if not all([AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_API_KEY, AZURE_OPENAI_EMBEDDING_DEPLOYMENT, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY]):
         print("エラー: 必要な環境変数が設定されていません。.envを確認してください。")
@@ -65,17 +237,19 @@ def main():
         return
 
 
-    # クライアントの初期化
+    # クライアントの初期化（再試行は共通のスケジューラで行うため、SDK側の再試行は無効化）
     openai_client = AzureOpenAI(
         azure_endpoint=AZURE_OPENAI_ENDPOINT,
         api_key=AZURE_OPENAI_API_KEY,
-        api_version=AZURE_OPENAI_API_VERSION
+        api_version=AZURE_OPENAI_API_VERSION,
+        max_retries=0
     )
 
     search_client = SearchClient(
         endpoint=AZURE_SEARCH_ENDPOINT,
         index_name=INDEX_NAME,
-        credential=AzureKeyCredential(AZURE_SEARCH_API_KEY)
+        credential=AzureKeyCredential(AZURE_SEARCH_API_KEY),
+        retry_total=0
     )
     
     try:
@@ -85,103 +259,34 @@ def main():
         return
 
 
-    # 1. ファイルの探索と解析
-    # Content Understandingがサポートする拡張子（例）
-    SUPPORTED_EXTENSIONS = ['*.pdf', '*.png', '*.jpg', '*.jpeg', '*.tiff', '*.docx', '*.xlsx', '*.pptx', '*.html']
-    target_files = []
-    for ext in SUPPORTED_EXTENSIONS:
-        target_files.extend(glob.glob(os.path.join(PDF_DIR, ext)))
-    
-    if not target_files:
-        print(f"警告: '{PDF_DIR}' ディレクトリに対象ファイルが見つかりません。")
-        # ダミーデータなどもここには含めず終了
-        return
+    # 1. ファイルの探索（サブディレクトリも含めて1件ずつ処理する）
+    # 2〜4. ファイルごとに解析し、UPLOAD_BATCH_SIZE 件のチャンクごとにベクトル化・アップロードすることで、
+    # ファイル数や文書の大きさによらずメモリ使用量を一定に保つ
+    processed = 0
+    uploaded = 0
 
-    documents = []
-    
-    print(f"{len(target_files)} 件のファイルを処理します...")
-    
-    for file_path in target_files:
-        file_name = os.path.basename(file_path)
-        # Azure Searchのキーとして使用するためにBase64エンコード（URLセーフ）
-        doc_id = base64.urlsafe_b64encode(file_name.encode("utf-8")).decode("utf-8")
+    for file_path in discover_files(PDF_DIR):
+        processed += 1
+        # サブディレクトリ内の同名ファイルを区別するため、PDF_DIR からの相対パスをファイル名とする
+        file_name = os.path.relpath(file_path, PDF_DIR).replace(os.sep, "/")
         
         # 既にインデックスに存在するか確認
-        try:
-            results = search_client.search(search_text="*", filter=f"file_name eq '{file_name}'", top=1)
-            if any(results):
-                print(f"スキップ: {file_name} (既にインデックスに存在します)")
-                continue
-        except Exception as e:
-            print(f"検索エラー (スキップ確認中): {e}")
+        if is_indexed(search_client, file_name):
+            print(f"スキップ: {file_name} (既にインデックスに存在します)")
+            continue
 
         print(f"\nProcessing: {file_name}")
         try:
-            # Content Understandingで解析
-            markdown_content = cu_client.analyze_file(file_path)
-            
-            # 解析結果が空でないか確認
-            if not markdown_content:
-                print(f"スキップ: 解析結果が空でした ({file_name})")
-                continue
-
-            # 2. Markdownをチャンク分割
-            chunks = chunk_markdown_by_headers(markdown_content)
-            print(f"  - {len(chunks)} チャンクに分割されました")
-
-            for i, chunk_content in enumerate(chunks):
-                 # ドキュメントオブジェクト作成
-                chunk_doc = {
-                    "id": f"{doc_id}_{i}",
-                    "content": chunk_content,
-                    "file_name": file_name,
-                    "file_id": doc_id,
-                    "chunk_no": i
-                }
-                documents.append(chunk_doc)
-            
+            _, file_uploaded = ingest_file(cu_client, openai_client, search_client, file_path, file_name)
+            uploaded += file_uploaded
         except Exception as e:
-            print(f"解析エラー ({file_name}): {e}")
+            print(f"取り込みエラー ({file_name}): {e}")
 
-    if not documents:
-        print("登録対象のドキュメントがありません。")
+    if processed == 0:
+        print(f"警告: '{PDF_DIR}' ディレクトリに対象ファイルが見つかりません。")
         return
 
-    # 3. ベクトル化
-    print(f"\n{len(documents)} 件のチャンクのベクトル化を開始します...")
-    for doc in documents:
-        try:
-            # Embeddingモデルのトークン制限（8191トークンなど）に注意が必要
-            # 長い場合は切り詰めるかチャンク分割が必要
-            # ここでは簡易的に先頭文字で制限
-            content_to_embed = doc["content"][:8000] 
-            
-            response = openai_client.embeddings.create(
-                input=content_to_embed,
-                model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT
-            )
-            embedding = response.data[0].embedding
-            doc["content_vector"] = embedding
-            # print(f"ドキュメント ID: {doc['id']} のベクトル化完了")
-            
-        except Exception as e:
-            print(f"ベクトル化エラー (ID: {doc['id']}): {e}")
-
-    # 4. ドキュメントのアップロード
-    # 4. ドキュメントのアップロード
-    # search_client is already initialized
-
-    try:
-        # ベクトル化に失敗して content_vector がないドキュメントを除外
-        valid_docs = [d for d in documents if "content_vector" in d]
-        if valid_docs:
-            result = search_client.upload_documents(documents=valid_docs)
-            print(f"\nドキュメントアップロード結果: {len(result)} 件成功")
-        else:
-            print("アップロード可能なドキュメントがありません。")
-            
-    except Exception as e:
-        print(f"アップロードエラー: {e}")
+    print(f"\n{processed} 件のファイルを処理し、{uploaded} 件のチャンクを登録しました。")
 
 if __name__ == "__main__":
     main()
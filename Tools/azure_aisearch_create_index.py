@@ -13,6 +13,12 @@ from azure.search.documents.indexes.models import (
     VectorSearchProfile,
     VectorSearchAlgorithmKind,
     HnswParameters,
+    AzureOpenAIVectorizer,
+    AzureOpenAIVectorizerParameters,
+    SemanticConfiguration,
+    SemanticPrioritizedFields,
+    SemanticField,
+    SemanticSearch,
 )
 
 # 環境変数の読み込み（ルートディレクトリの.envを参照）
@@ -23,6 +29,14 @@ load_dotenv(ROOT_DIR / ".env")
 # 設定値の取得
 AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
 AZURE_SEARCH_API_KEY = os.getenv("AZURE_SEARCH_API_KEY")
+# HNSW の検索時の候補数（benchmarks/bench_retrieval.py で再現率とレイテンシから選定できる）
+AZURE_AI_SEARCH_EF_SEARCH = int(os.getenv("AZURE_AI_SEARCH_EF_SEARCH", "500"))
+# セマンティック検索の構成名（設定した場合のみ構成を作成）
+AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION = os.getenv("AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION", "")
+# クエリのベクトル化に使用する Azure OpenAI（設定した場合のみベクトル化の設定を追加）
+AZURE_OPENAI_API_ENDPOINT = os.getenv("AZURE_OPENAI_API_ENDPOINT", "")
+AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY", "")
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-large")
 
 INDEX_NAME = "vector-sample-index"
 
@@ -38,6 +52,22 @@ def create_index():
 
     print(f"インデックス '{INDEX_NAME}' の作成を開始します...")
     
+    # クエリのベクトル化の設定
+    # Researcher の検索ツールで vector 系の検索方式を使う場合、検索サービス側でクエリをベクトル化する必要がある
+    vectorizers = []
+    if AZURE_OPENAI_API_ENDPOINT and AZURE_OPENAI_API_KEY:
+        vectorizers.append(
+            AzureOpenAIVectorizer(
+                vectorizer_name="myOpenAIVectorizer",
+                parameters=AzureOpenAIVectorizerParameters(
+                    resource_url=AZURE_OPENAI_API_ENDPOINT,
+                    deployment_name=AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+                    model_name="text-embedding-3-large",
+                    api_key=AZURE_OPENAI_API_KEY,
+                ),
+            )
+        )
+
     # ベクトル検索の設定
     vector_search = VectorSearch(
         algorithms=[
@@ -47,7 +77,7 @@ def create_index():
                 parameters=HnswParameters(
                     m=4,
                     ef_construction=400,
-                    ef_search=500,
+                    ef_search=AZURE_AI_SEARCH_EF_SEARCH,
                     metric="cosine"
                 )
             )
@@ -56,10 +86,26 @@ def create_index():
             VectorSearchProfile(
                 name="myHnswProfile",
                 algorithm_configuration_name="myHnsw",
+                vectorizer_name="myOpenAIVectorizer" if vectorizers else None,
             )
-        ]
+        ],
+        vectorizers=vectorizers,
     )
 
+    # セマンティック検索の設定（semantic 系の検索方式で使用）
+    semantic_search = None
+    if AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION:
+        semantic_search = SemanticSearch(
+            configurations=[
+                SemanticConfiguration(
+                    name=AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION,
+                    prioritized_fields=SemanticPrioritizedFields(
+                        content_fields=[SemanticField(field_name="content")]
+                    ),
+                )
+            ]
+        )
+
     # フィールド定義
     fields = [
         SimpleField(name="id", type="Edm.String", key=True, filterable=True),
@@ -76,7 +122,9 @@ def create_index():
         SimpleField(name="chunk_no", type="Edm.Int32", filterable=True, sortable=True),
     ]
 
-    index = SearchIndex(name=INDEX_NAME, fields=fields, vector_search=vector_search)
+    index = SearchIndex(
+        name=INDEX_NAME, fields=fields, vector_search=vector_search, semantic_search=semantic_search
+    )
     
     try:
         index_client.create_or_update_index(index)
@@ -1,5 +1,6 @@
 #%%
 import os
+import tempfile
 import time
 import requests
 import json
@@ -9,21 +10,74 @@ from dotenv import load_dotenv
 
 # 環境変数の読み込み（ルートディレクトリの.envを参照）
 import pathlib
+import sys
 ROOT_DIR = pathlib.Path(__file__).parent.parent
 load_dotenv(ROOT_DIR / ".env")
 
+# ルートディレクトリをパスに追加（共通のレート制限を使用するため）
+sys.path.insert(0, str(ROOT_DIR))
+from rate_limiter import RETRYABLE_STATUS_CODES, Priority, ThrottledError, get_scheduler, retry_after_from_headers
+
 # 設定値の取得（環境変数から）
 CU_ENDPOINT = os.getenv("AZURE_CONTENT_UNDERSTANDING_ENDPOINT")
 CU_API_KEY = os.getenv("AZURE_CONTENT_UNDERSTANDING_API_KEY")
 CU_ANALYZER_ID = os.getenv("AZURE_CONTENT_UNDERSTANDING_ANALYZER_ID")
 CU_API_VERSION = "2024-12-01-preview" # ユーザー指定または公式サンプルの推奨に合わせる
+# サービスの入力上限（超えるPDFはページ範囲に分割して解析する）
+CU_MAX_UPLOAD_BYTES = int(float(os.getenv("AZURE_CONTENT_UNDERSTANDING_MAX_UPLOAD_MB", "200")) * 1024 * 1024)
+CU_MAX_PAGES = int(os.getenv("AZURE_CONTENT_UNDERSTANDING_MAX_PAGES", "300"))
+
+
+def iter_pdf_parts(file_path, max_pages=None, max_bytes=None):
+    """
+    PDFをページ範囲ごとの一時ファイルに分割し、(開始ページ, 終了ページ, 一時ファイルのパス) を返します。
+    一時ファイルは次の範囲に進むときに削除されます。分割には pypdf が必要です。
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError as e:
+        raise ValueError(
+            f"{file_path} はサービスの上限を超えています。ページ範囲で分割するには pypdf をインストールしてください。"
+        ) from e
+
+    max_pages = max_pages or CU_MAX_PAGES
+    max_bytes = max_bytes or CU_MAX_UPLOAD_BYTES
+    reader = PdfReader(file_path)
+    total_pages = len(reader.pages)
+    # ページあたりのサイズを平均とみなし、上限の8割に収まるページ数から始める
+    average = os.path.getsize(file_path) / max(1, total_pages)
+    pages_per_part = max(1, min(max_pages, int(max_bytes * 0.8 / max(1.0, average))))
+
+    start = 0
+    while start < total_pages:
+        end = min(total_pages, start + pages_per_part)
+        fd, part_path = tempfile.mkstemp(suffix=".pdf", prefix="cu-part-")
+        try:
+            writer = PdfWriter()
+            for index in range(start, end):
+                writer.add_page(reader.pages[index])
+            with os.fdopen(fd, "wb") as f:
+                writer.write(f)
+            if os.path.getsize(part_path) > max_bytes and end - start > 1:
+                # 特定のページが大きい場合は範囲を半分にしてやり直す
+                pages_per_part = max(1, (end - start) // 2)
+                continue
+            yield start + 1, end, part_path
+        finally:
+            os.remove(part_path)
+        start = end
 
 class ContentUnderstandingClient:
-    def __init__(self, endpoint=None, api_key=None, analyzer_id=None, api_version=None):
+    def __init__(self, endpoint=None, api_key=None, analyzer_id=None, api_version=None, polling_interval_seconds=2,
+                 scheduler=None, priority=Priority.BULK):
         self.endpoint = (endpoint or CU_ENDPOINT).rstrip("/")
         self.api_key = api_key or CU_API_KEY
         self.analyzer_id = analyzer_id or CU_ANALYZER_ID
         self.api_version = api_version or CU_API_VERSION
+        self.polling_interval_seconds = polling_interval_seconds
+        # レート制限・再試行（既定ではプロセス共通のスケジューラを一括取り込みの優先度で使用）
+        self.scheduler = scheduler or get_scheduler()
+        self.priority = priority
         
         if not all([self.endpoint, self.api_key, self.analyzer_id]):
             raise ValueError("Environment variables for Content Understanding are not set.")
@@ -37,21 +91,86 @@ class ContentUnderstandingClient:
             "x-ms-useragent": "cu-sample-code-python"
         }
 
+    def _request(self, method, url, body_path=None, **kwargs):
+        """
+        レート制限に従ってリクエストを送信し、スロットリングや一時的な失敗は再試行します。
+        body_path を指定した場合は、ファイル全体をメモリに読み込まずに本文としてストリーミングします
+        （再試行のたびにファイルを開き直します）。
+        """
+        def send():
+            try:
+                if body_path is None:
+                    response = requests.request(method, url, **kwargs)
+                else:
+                    with open(body_path, "rb") as body:
+                        response = requests.request(method, url, data=body, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                raise ThrottledError(f"Request error: {e}") from e
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                raise ThrottledError(
+                    f"Request throttled: {response.status_code}",
+                    retry_after=retry_after_from_headers(response.headers),
+                )
+            return response
+
+        return self.scheduler.call("content_understanding", send, priority=self.priority)
+
     def analyze_file(self, file_path):
         """
         ローカルファイルをアップロードして解析し、Markdown結果を返します。
         """
+        return "\n\n".join(self.iter_analyze_file(file_path))
+
+    def iter_analyze_file(self, file_path, max_pages=None, max_bytes=None):
+        """
+        ローカルファイルを解析し、Markdown結果を返すジェネレータ。
+        サービスの上限（サイズ・ページ数）を超えるPDFはページ範囲ごとに分割して解析し、
+        範囲ごとのMarkdownを順に返します。
+        """
+        max_pages = max_pages or CU_MAX_PAGES
+        max_bytes = max_bytes or CU_MAX_UPLOAD_BYTES
+        if not file_path.lower().endswith(".pdf"):
+            if os.path.getsize(file_path) > max_bytes:
+                raise ValueError(f"{file_path} はサービスの上限（{max_bytes} バイト）を超えています。")
+            yield self._analyze_path(file_path)
+            return
+
+        if os.path.getsize(file_path) <= max_bytes and self._page_count(file_path) <= max_pages:
+            yield self._analyze_path(file_path)
+            return
+
+        for first_page, last_page, part_path in iter_pdf_parts(file_path, max_pages, max_bytes):
+            print(f"Analyzing pages {first_page}-{last_page} of {file_path}")
+            yield self._analyze_path(part_path)
+
+    def _page_count(self, file_path):
+        """
+        PDFのページ数を返します（pypdf がない場合は 0 とし、サイズのみで判定します）。
+        """
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            return 0
+        with open(file_path, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                return 0
+        try:
+            return len(PdfReader(file_path).pages)
+        except Exception:
+            # 解析できないPDFはそのままサービスに送る
+            return 0
+
+    def _analyze_path(self, file_path):
         url = f"{self.endpoint}/contentunderstanding/analyzers/{self.analyzer_id}:analyze?api-version={self.api_version}&stringEncoding=utf16"
         
         headers = self._headers.copy()
         headers["Content-Type"] = "application/octet-stream"
+        headers["Content-Length"] = str(os.path.getsize(file_path))
 
         print(f"Uploading file: {file_path}")
-        with open(file_path, "rb") as f:
-            data = f.read()
 
-        # 1. 解析リクエスト送信
-        response = requests.post(url, headers=headers, data=data)
+        # 1. 解析リクエスト送信（ファイルはストリーミングで送信）
+        response = self._request("POST", url, headers=headers, body_path=file_path)
         
         if response.status_code != 202:
             raise Exception(f"Analysis request failed: {response.status_code}, {response.text}")
@@ -63,7 +182,7 @@ class ContentUnderstandingClient:
         print(f"Analysis started. Polling URL: {operation_location}")
 
         # 2. ポーリング
-        return self._poll_result(operation_location)
+        return self._poll_result(operation_location, polling_interval_seconds=self.polling_interval_seconds)
 
     def _poll_result(self, operation_location, timeout_seconds=120, polling_interval_seconds=2):
         headers = self._headers.copy()
@@ -74,7 +193,7 @@ class ContentUnderstandingClient:
             if elapsed_time > timeout_seconds:
                 raise TimeoutError(f"Operation timed out after {timeout_seconds:.2f} seconds.")
 
-            response = requests.get(operation_location, headers=headers)
+            response = self._request("GET", operation_location, headers=headers)
             if response.status_code != 200:
                  raise Exception(f"Polling failed: {response.status_code}, {response.text}")
 
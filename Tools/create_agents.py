@@ -43,12 +43,15 @@ def create_agents() -> dict[str, str]:
     
     # Azure AI Search ツールの設定
     # 注意: AZURE_AI_SEARCH_CONNECTION_ID は Azure AI Foundry ポータルから取得する必要があります
+    # 検索方式と取得件数は benchmarks/bench_retrieval.py で評価して選定した値（.env）を使用する
+    # （vector 系の検索方式には、インデックスにベクトル化の設定が必要）
     search_tool = AzureAISearchTool(
         index_connection_id=config.AZURE_AI_SEARCH_CONNECTION_ID,
         index_name=config.AZURE_AI_SEARCH_INDEX_NAME,
-        query_type=AzureAISearchQueryType.SIMPLE,  # シンプルキーワード検索
-        top_k=5,
+        query_type=AzureAISearchQueryType(config.RETRIEVAL_QUERY_TYPE),
+        top_k=config.RETRIEVAL_TOP_K,
     )
+    print(f"Researcher の検索設定: query_type={config.RETRIEVAL_QUERY_TYPE}, top_k={config.RETRIEVAL_TOP_K}")
     
     agent_ids = {}
     
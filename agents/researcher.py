@@ -16,6 +16,12 @@ Azure AI Searchを使用して、指定されたクエリに基づいて情報
 2. 各クエリに対して関連情報を検索する
 3. 取得した情報を整理して報告する
 
+## 事前取得された根拠がある場合
+入力に「取得済みの根拠」や「検索済みのクエリ」のセクションがある場合は、クライアント側で検索済みです。
+- 「取得済みの根拠」の内容を優先して使用し、同じクエリを検索ツールで再検索しない
+- 「検索済みのクエリ」は前回までの調査結果に含まれるため、再検索しない
+- 根拠だけでは不足する点がある場合のみ、不足する内容に絞って検索ツールを使用する
+
 ## 出力形式
 以下のJSON形式で出力してください:
 ```json
@@ -0,0 +1,16 @@
+"""
+ベンチマークモジュール
+
+Azureリソースを使わずに性能を計測するためのシミュレーション環境と
+ベンチマークスクリプトを提供する:
+- simulated_agents: AIProjectClient.agents のローカル代替
+- bench_research: DeepResearchRunner のスループット・レイテンシ計測
+"""
+
+from .simulated_agents import LatencyModel, SimulatedProjectClient, SimulatedRetriever
+
+__all__ = [
+    "LatencyModel",
+    "SimulatedProjectClient",
+    "SimulatedRetriever",
+]
@@ -0,0 +1,284 @@
+# %%
+"""
+データ取り込みベンチマークスクリプト
+
+合成コーパスを生成し、ローカルのモックサーバー（Content Understanding /
+Embeddings / AI Search）に対して Tools/add_vector_index.py と同じく、ファイルごとに ingest_file で
+取り込む（チャンクは UPLOAD_BATCH_SIZE 件ずつベクトル化・アップロードされる）。
+docs/秒、chunks/秒、ピークRSS、ステージごとの所要時間を出力する。
+
+    python benchmarks/bench_ingestion.py --documents 10000 --throttle-rate 0.02
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import pathlib
+import shutil
+import tempfile
+import time
+import urllib.request
+
+# ルートディレクトリとToolsディレクトリをパスに追加
+ROOT_DIR = pathlib.Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "Tools"))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents import SearchClient
+from openai import AzureOpenAI
+
+import add_vector_index
+from content_understanding_client import ContentUnderstandingClient
+from rate_limiter import get_scheduler
+from benchmarks.mock_servers import MockSettings, serve
+from benchmarks.synthetic_corpus import CorpusSpec, generate_corpus
+
+
+# %%
+def peak_rss_mb() -> float | None:
+    """
+    このプロセスのピークRSS（MB）を返す。取得できない環境ではNone。
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def start_mock_server(settings: MockSettings):
+    """
+    モックサーバーを別プロセスで起動する（RSS計測に含めないため）。
+
+    Returns:
+        tuple: (プロセス, ベースURL)
+    """
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(settings, port_queue), daemon=True)
+    process.start()
+    port = port_queue.get(timeout=30)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def fetch_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(f"{base_url}/_stats") as response:
+        return json.loads(response.read())
+
+
+@contextlib.contextmanager
+def timed_stages(timings: dict, stats: dict):
+    """
+    ingest_file が呼び出すベクトル化・アップロードの所要時間を timings に加算する。
+    ベクトル化に失敗したチャンク数は stats["embedding_errors"] に加算する。
+    """
+    embed_documents = add_vector_index.embed_documents
+    upload_documents = add_vector_index.upload_documents
+
+    def timed_embed(openai_client, documents, model=None, scheduler=None):
+        start = time.perf_counter()
+        try:
+            return embed_documents(openai_client, documents, model="mock-embedding", scheduler=scheduler)
+        finally:
+            timings["embed"] += time.perf_counter() - start
+            stats["embedding_errors"] += sum(1 for d in documents if "content_vector" not in d)
+
+    def timed_upload(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return upload_documents(*args, **kwargs)
+        finally:
+            timings["upload"] += time.perf_counter() - start
+
+    add_vector_index.embed_documents = timed_embed
+    add_vector_index.upload_documents = timed_upload
+    try:
+        yield
+    finally:
+        add_vector_index.embed_documents = embed_documents
+        add_vector_index.upload_documents = upload_documents
+
+
+# %%
+def run_benchmark(corpus_dir: str, base_url: str) -> dict:
+    """
+    取り込みの各ステージを実行し、計測結果を返す。
+
+    Args:
+        corpus_dir: 合成コーパスのディレクトリ
+        base_url: モックサーバーのURL
+
+    Returns:
+        dict: 計測結果
+    """
+    cu_client = ContentUnderstandingClient(
+        endpoint=base_url,
+        api_key="mock",
+        analyzer_id="mock-analyzer",
+        polling_interval_seconds=0,
+    )
+    openai_client = AzureOpenAI(
+        azure_endpoint=base_url,
+        api_key="mock",
+        api_version="2024-08-01-preview",
+        max_retries=0,
+    )
+    search_client = SearchClient(
+        endpoint=base_url,
+        index_name=add_vector_index.INDEX_NAME,
+        credential=AzureKeyCredential("mock"),
+        retry_total=0,
+    )
+
+    timings = {}
+    stats = {"embedding_errors": 0}
+    errors = 0
+    chunks = 0
+    uploaded = 0
+
+    # 各ステージのログ出力は計測の妨げになるため抑制する
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        target_files = list(add_vector_index.discover_files(corpus_dir))
+        timings["discover"] = time.perf_counter() - start
+
+        timings["skip_check"] = 0.0
+        timings["analyze"] = 0.0
+        timings["embed"] = 0.0
+        timings["upload"] = 0.0
+        with timed_stages(timings, stats):
+            for file_path in target_files:
+                start = time.perf_counter()
+                indexed = add_vector_index.is_indexed(search_client, os.path.basename(file_path))
+                timings["skip_check"] += time.perf_counter() - start
+                if indexed:
+                    continue
+
+                # 解析はチャンクの生成と交互に行われるため、ファイル全体の時間からベクトル化・アップロードを除いて計上する
+                start = time.perf_counter()
+                embed_before, upload_before = timings["embed"], timings["upload"]
+                try:
+                    file_chunks, file_uploaded = add_vector_index.ingest_file(
+                        cu_client, openai_client, search_client, file_path
+                    )
+                    chunks += file_chunks
+                    uploaded += file_uploaded
+                except Exception:
+                    errors += 1
+                elapsed = time.perf_counter() - start
+                timings["analyze"] += elapsed - (timings["embed"] - embed_before) - (timings["upload"] - upload_before)
+
+    total = sum(timings.values())
+    return {
+        "files": len(target_files),
+        "chunks": chunks,
+        "errors": errors,
+        "embedding_errors": stats["embedding_errors"],
+        "uploaded": uploaded,
+        "elapsed_seconds": total,
+        "docs_per_second": len(target_files) / total if total else 0.0,
+        "chunks_per_second": chunks / total if total else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "stage_seconds": timings,
+        "scheduler": get_scheduler().stats(),
+    }
+
+
+def print_report(result: dict) -> None:
+    """
+    計測結果を表示する。
+    """
+    print("=" * 60)
+    print("データ取り込みベンチマーク結果")
+    print("=" * 60)
+    print(f"ファイル数: {result['files']} / チャンク数: {result['chunks']}")
+    print(f"取り込みエラー（ファイル）: {result['errors']} / ベクトル化エラー（チャンク）: {result['embedding_errors']}")
+    print(f"アップロード: {result['uploaded']} 件")
+    print(f"経過時間: {result['elapsed_seconds']:.2f} 秒")
+    print(f"docs/秒: {result['docs_per_second']:.2f}")
+    print(f"chunks/秒: {result['chunks_per_second']:.2f}")
+    if result["peak_rss_mb"] is not None:
+        print(f"ピークRSS: {result['peak_rss_mb']:.1f} MB")
+
+    print("\n[ステージ別所要時間]")
+    for stage, seconds in result["stage_seconds"].items():
+        print(f"  {stage:<12} {seconds:8.2f} 秒")
+
+    print("\n[スケジューラ]")
+    for service, stats in sorted(result["scheduler"].items()):
+        print(
+            f"  {service:<22} 呼び出し {stats['calls']:6.0f}  再試行 {stats['retries']:5.0f}"
+            f"  待機 {stats['waited']:7.2f} 秒"
+        )
+
+    server = result.get("server", {})
+    if server:
+        print("\n[モックサーバー]")
+        for route, count in sorted(server["requests"].items()):
+            throttled = server["throttled"].get(route, 0)
+            print(f"  {route:<14} {count:8d} リクエスト (429: {throttled})")
+
+
+# %%
+def main() -> int:
+    parser = argparse.ArgumentParser(description="データ取り込みオフラインベンチマーク")
+    parser.add_argument("--documents", type=int, default=1000, help="生成するファイル数")
+    parser.add_argument("--min-sections", type=int, default=3)
+    parser.add_argument("--max-sections", type=int, default=10)
+    parser.add_argument("--min-section-chars", type=int, default=200)
+    parser.add_argument("--max-section-chars", type=int, default=2000)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="429 を返す確率")
+    parser.add_argument("--retry-after-ms", type=int, default=100)
+    parser.add_argument("--cu-polls", type=int, default=1, help="解析完了までのポーリング回数")
+    parser.add_argument("--latency", type=float, default=0.0, help="モックAPIの遅延（秒）")
+    parser.add_argument("--dimensions", type=int, default=3072, help="ベクトルの次元数")
+    parser.add_argument("--workdir", help="コーパスの出力先（省略時は一時ディレクトリ）")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ingestion-bench-")
+    spec = CorpusSpec(
+        documents=args.documents,
+        sections=(args.min_sections, args.max_sections),
+        section_chars=(args.min_section_chars, args.max_section_chars),
+    )
+    print(f"合成コーパスを生成中: {workdir}")
+    for _ in generate_corpus(workdir, spec):
+        pass
+
+    settings = MockSettings(
+        throttle_rate=args.throttle_rate,
+        retry_after_ms=args.retry_after_ms,
+        cu_polls=args.cu_polls,
+        latency=args.latency,
+        dimensions=args.dimensions,
+    )
+    process, base_url = start_mock_server(settings)
+    try:
+        result = run_benchmark(workdir, base_url)
+        result["server"] = fetch_stats(base_url)
+    finally:
+        process.terminate()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
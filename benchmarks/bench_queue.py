@@ -0,0 +1,89 @@
+# %%
+"""
+分散ワーカーのスケーリングベンチマーク
+
+SQLite ジョブキューにシミュレーション用の調査ジョブを投入し、
+ワーカープロセス数を変えてスループット（ジョブ/秒）を計測する。
+
+    python benchmarks/bench_queue.py --jobs 40 --workers 1,2,4,8
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import pathlib
+import tempfile
+import time
+
+# ルートディレクトリをパスに追加
+ROOT_DIR = pathlib.Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import config
+from job_queue import open_queue
+from worker import Worker
+
+
+# %%
+def run_worker(queue_url: str, checkpoint_dir: str) -> None:
+    """
+    キューが空になるまでジョブを処理する（子プロセス用）。
+    """
+    config.CHECKPOINT_DIR = checkpoint_dir
+    with contextlib.redirect_stdout(io.StringIO()):
+        Worker(open_queue(queue_url), kinds=["research"], simulated=True).run(exit_when_empty=True)
+
+
+def measure(jobs: int, workers: int) -> float:
+    """
+    指定したワーカー数でジョブをすべて処理するまでの秒数を返す。
+    """
+    with tempfile.TemporaryDirectory(prefix="bench-queue-") as directory:
+        queue_url = f"sqlite:///{os.path.join(directory, 'jobs.db')}"
+        queue = open_queue(queue_url)
+        for i in range(jobs):
+            queue.enqueue("research", {"question": f"ベンチマーク質問 {i}"})
+
+        start = time.perf_counter()
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(queue_url, directory))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        completed = queue.stats().get("completed", 0)
+        if completed != jobs:
+            print(f"警告: {jobs} 件中 {completed} 件のみ完了しました。")
+        return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="分散ワーカーのスケーリングベンチマーク")
+    parser.add_argument("--jobs", type=int, default=40, help="投入するジョブ数")
+    parser.add_argument("--workers", default="1,2,4", help="計測するワーカー数（カンマ区切り）")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("分散ワーカー スケーリングベンチマーク")
+    print("=" * 60)
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        elapsed = measure(args.jobs, workers)
+        throughput = args.jobs / elapsed
+        baseline = baseline or throughput
+        print(
+            f"  ワーカー {workers:3d}: {elapsed:7.2f} 秒  {throughput:7.2f} ジョブ/秒"
+            f"  （1台あたり効率 {throughput / baseline / workers:5.0%}）"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
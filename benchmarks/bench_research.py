@@ -0,0 +1,319 @@
+# %%
+"""
+Deep Research ベンチマークスクリプト
+
+シミュレーション用 Agents バックエンド上で DeepResearchRunner を実行し、
+スループット（質問/秒）、ステージごとのレイテンシ、イテレーションごとの
+プロンプトサイズを計測する。
+
+--retrieval を指定すると Researcher の前にシミュレーション用の検索で根拠を取得し、
+事前取得の検索回数と検索結果メモの効果を計測する（--shared-memo でセッションをまたいだメモも使用）。
+シミュレーションの Researcher は検索ツールを呼ばないため、実環境の Researcher の検索は含まない。
+
+ベースラインと比較して回帰を検出できる:
+    python benchmarks/bench_research.py --save-baseline bench_baseline.json
+    python benchmarks/bench_research.py --baseline bench_baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import pathlib
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# ルートディレクトリをパスに追加
+ROOT_DIR = pathlib.Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import config
+from checkpoint import CheckpointStore
+from client_factory import AgentCache
+from run_deep_research import DeepResearchRunner
+from rate_limiter import RetryScheduler, ServiceLimits, ThrottledError
+from retrieval import SharedRetrievalMemo
+from benchmarks.simulated_agents import LatencyModel, SimulatedProjectClient, SimulatedRetriever, SimulationSettings
+
+
+# %%
+def percentile(values: list[float], pct: float) -> float:
+    """
+    最近傍順位法でパーセンタイルを計算する。
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    """
+    平均・p50・p95 を計算する。
+    """
+    return {
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+    }
+
+
+# %%
+def run_benchmark(
+    questions: int,
+    concurrency: int,
+    settings: SimulationSettings,
+    max_iterations: int,
+    poll_interval: float,
+    scheduler: RetryScheduler | None = None,
+    retriever: SimulatedRetriever | None = None,
+    shared_memo: bool = False,
+) -> dict:
+    """
+    ベンチマークを実行して結果を辞書で返す。
+
+    Args:
+        questions: 実行する質問数
+        concurrency: 同時に実行する質問数
+        settings: シミュレーション設定
+        max_iterations: 最大イテレーション数
+        poll_interval: 実行状態のポーリング間隔（秒）
+        scheduler: レート制限・再試行に使用するスケジューラ
+        retriever: Researcher の前に根拠を取得するシミュレーション用の検索
+        shared_memo: セッションをまたいだ検索結果メモを使用するか
+
+    Returns:
+        dict: 計測結果
+    """
+    config.MAX_RESEARCH_ITERATIONS = max_iterations
+    config.RUN_POLL_INTERVAL_SECONDS = poll_interval
+
+    client = SimulatedProjectClient(settings)
+    scheduler = scheduler or RetryScheduler()
+    checkpoint_dir = tempfile.TemporaryDirectory(prefix="bench-checkpoints-")
+    runner = DeepResearchRunner(
+        client=client,
+        agent_ids=client.agent_ids,
+        scheduler=scheduler,
+        checkpoints=CheckpointStore(checkpoint_dir.name),
+        agent_cache=AgentCache(persist=False),
+        retriever=retriever,
+        shared_memo=SharedRetrievalMemo(f"{checkpoint_dir.name}/retrieval.db") if shared_memo else None,
+    )
+
+    question_latencies = []
+    failures = 0
+
+    def run_one(index: int) -> float | None:
+        start = time.perf_counter()
+        try:
+            runner.run(f"ベンチマーク質問 {index}")
+        except (RuntimeError, ThrottledError):
+            # 再試行しきれなかったスロットリングも失敗として数える
+            return None
+        return time.perf_counter() - start
+
+    # Runner の進捗表示は計測の妨げになるため抑制する
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for latency in executor.map(run_one, range(questions)):
+                if latency is None:
+                    failures += 1
+                else:
+                    question_latencies.append(latency)
+    elapsed = time.perf_counter() - start
+    checkpoint_dir.cleanup()
+
+    stage_latencies = defaultdict(list)
+    prompt_sizes = defaultdict(list)
+    for record in client.records:
+        if record.status != "completed":
+            continue
+        stage_latencies[record.stage].append(record.latency)
+        if record.iteration is not None:
+            prompt_sizes[f"{record.stage}@{record.iteration}"].append(record.prompt_chars)
+
+    result = {
+        "questions": questions,
+        "concurrency": concurrency,
+        "completed": len(question_latencies),
+        "failed": failures,
+        "elapsed_seconds": elapsed,
+        "questions_per_second": len(question_latencies) / elapsed if elapsed else 0.0,
+        "question_latency": summarize(question_latencies),
+        "stage_latency": {stage: summarize(v) for stage, v in sorted(stage_latencies.items())},
+        "scheduler": scheduler.stats(),
+        "prompt_chars": {
+            key: sum(v) / len(v) for key, v in sorted(prompt_sizes.items())
+        },
+    }
+    if retriever is not None:
+        completed = max(1, len(question_latencies))
+        result["retrieval"] = {
+            "search_calls": retriever.search_calls,
+            "searches_per_question": retriever.search_calls / completed,
+            "embed_calls": retriever.embed_calls,
+            "researcher_prompt_chars": summarize([
+                r.prompt_chars for r in client.records if r.stage == "researcher" and r.status == "completed"
+            ]),
+        }
+    return result
+
+
+# %%
+def find_regressions(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    ベースラインと比較し、許容範囲を超えて悪化した指標を列挙する。
+
+    Args:
+        result: 今回の計測結果
+        baseline: 比較対象の計測結果
+        tolerance: 許容する悪化率（0.2 なら 20%）
+
+    Returns:
+        list[str]: 回帰の説明（回帰がなければ空）
+    """
+    regressions = []
+
+    base_qps = baseline["questions_per_second"]
+    if result["questions_per_second"] < base_qps * (1 - tolerance):
+        regressions.append(
+            f"questions/sec: {base_qps:.2f} -> {result['questions_per_second']:.2f}"
+        )
+
+    for stage, stats in baseline["stage_latency"].items():
+        current = result["stage_latency"].get(stage)
+        if current and current["p95"] > stats["p95"] * (1 + tolerance):
+            regressions.append(
+                f"{stage} p95: {stats['p95'] * 1000:.1f}ms -> {current['p95'] * 1000:.1f}ms"
+            )
+
+    for key, chars in baseline["prompt_chars"].items():
+        current = result["prompt_chars"].get(key)
+        if current and current > chars * (1 + tolerance):
+            regressions.append(f"prompt chars {key}: {chars:.0f} -> {current:.0f}")
+
+    return regressions
+
+
+def print_report(result: dict) -> None:
+    """
+    計測結果を表示する。
+    """
+    print("=" * 60)
+    print("Deep Research ベンチマーク結果")
+    print("=" * 60)
+    print(f"質問数: {result['questions']} (同時実行 {result['concurrency']})")
+    print(f"完了: {result['completed']} / 失敗: {result['failed']}")
+    print(f"経過時間: {result['elapsed_seconds']:.2f} 秒")
+    print(f"スループット: {result['questions_per_second']:.2f} 質問/秒")
+    q = result["question_latency"]
+    print(f"質問あたり: mean {q['mean']:.3f}s / p50 {q['p50']:.3f}s / p95 {q['p95']:.3f}s")
+
+    print("\n[ステージ別レイテンシ]")
+    for stage, stats in result["stage_latency"].items():
+        print(
+            f"  {stage:<10} mean {stats['mean'] * 1000:8.1f}ms"
+            f"  p50 {stats['p50'] * 1000:8.1f}ms  p95 {stats['p95'] * 1000:8.1f}ms"
+        )
+
+    chat = result["scheduler"].get("chat")
+    if chat:
+        print(f"\n[スケジューラ] 呼び出し {chat['calls']:.0f} / 再試行 {chat['retries']:.0f}"
+              f" / 待機 {chat['waited']:.2f} 秒")
+
+    print("\n[イテレーション別プロンプトサイズ（文字数）]")
+    for key, chars in result["prompt_chars"].items():
+        print(f"  {key:<14} {chars:10.0f}")
+
+    retrieval = result.get("retrieval")
+    if retrieval:
+        # シミュレーションの Researcher は検索ツールを呼ばないため、回数はクライアント側の事前取得のみ
+        print(f"\n[検索] 事前取得の検索 {retrieval['search_calls']} 回（質問あたり {retrieval['searches_per_question']:.1f} 回）"
+              f" / ベクトル化 {retrieval['embed_calls']} 回（Researcher の検索ツールによる検索は含まない）")
+        chars = retrieval["researcher_prompt_chars"]
+        print(f"[Researcher プロンプトサイズ] mean {chars['mean']:.0f} / p95 {chars['p95']:.0f} 文字")
+
+
+# %%
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Deep Research オフラインベンチマーク")
+    parser.add_argument("--questions", type=int, default=20, help="実行する質問数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時実行数")
+    parser.add_argument("--max-iterations", type=int, default=3, help="最大イテレーション数")
+    parser.add_argument("--complete-after", type=int, default=2,
+                        help="Critic が COMPLETE を返すまでの調査結果件数")
+    parser.add_argument("--latency-mean", type=float, default=0.05, help="エージェント実行時間の平均（秒）")
+    parser.add_argument("--latency-stddev", type=float, default=0.01, help="エージェント実行時間の標準偏差（秒）")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="API呼び出しごとの遅延（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="実行失敗率（0.0〜1.0）")
+    parser.add_argument("--failure-code", default="server_error",
+                        help="失敗時のエラーコード（rate_limit_exceeded で再試行を計測）")
+    parser.add_argument("--chat-rpm", type=int, default=0, help="chat の RPM クォータ（0 は制限なし）")
+    parser.add_argument("--retry-base-delay", type=float, default=0.01, help="再試行の基準待機時間（秒）")
+    parser.add_argument("--poll-interval", type=float, default=0.01, help="ポーリング間隔（秒）")
+    parser.add_argument("--retrieval", action="store_true", help="Researcher の前に根拠を事前取得する")
+    parser.add_argument("--shared-memo", action="store_true", help="セッションをまたいだ検索結果メモを使用")
+    parser.add_argument("--context-tokens", type=int, default=config.RETRIEVAL_CONTEXT_TOKENS,
+                        help="根拠のトークン数の上限（0 は MMR による詰め込みなし）")
+    parser.add_argument("--mmr-lambda", type=float, default=config.RETRIEVAL_MMR_LAMBDA, help="MMR の関連度の重み")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--baseline", help="比較するベースラインJSON")
+    parser.add_argument("--save-baseline", help="結果をベースラインJSONとして保存")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="許容する悪化率")
+    args = parser.parse_args()
+    config.RETRIEVAL_CONTEXT_TOKENS = args.context_tokens
+    config.RETRIEVAL_MMR_LAMBDA = args.mmr_lambda
+
+    latency = LatencyModel(mean=args.latency_mean, stddev=args.latency_stddev)
+    settings = SimulationSettings(
+        latency={stage: latency for stage in ("planner", "researcher", "critic", "report")},
+        api_latency=args.api_latency,
+        failure_rate=args.failure_rate,
+        failure_code=args.failure_code,
+        complete_after=args.complete_after,
+        seed=args.seed,
+    )
+
+    result = run_benchmark(
+        questions=args.questions,
+        concurrency=args.concurrency,
+        settings=settings,
+        max_iterations=args.max_iterations,
+        poll_interval=args.poll_interval,
+        scheduler=RetryScheduler(
+            limits={"chat": ServiceLimits(rpm=args.chat_rpm)},
+            base_delay=args.retry_base_delay,
+            seed=args.seed,
+        ),
+        retriever=SimulatedRetriever() if args.retrieval else None,
+        shared_memo=args.shared_memo,
+    )
+    print_report(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nベースラインを保存しました: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(result, baseline, args.tolerance)
+        if regressions:
+            print("\n回帰を検出しました:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("\n回帰は検出されませんでした。")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
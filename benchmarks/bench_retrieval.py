@@ -0,0 +1,356 @@
+# %%
+"""
+検索評価ベンチマークスクリプト
+
+正解付きのクエリセットを検索方式・取得件数（top_k）・HNSW の ef_search の組み合わせごとに実行し、
+recall@k、MRR、p50/p95 レイテンシを出力する。レイテンシの上限内で再現率が最も高い設定のうち、
+取得件数が最小のものを選び、--write-env で .env に書き込む
+（Tools/create_agents.py の Researcher の検索ツールと、根拠の事前取得で使用される）。
+
+クエリセットは1行1件のJSONL:
+    {"query": "...", "relevant": ["チャンクIDまたはファイル名", ...], "vector": [...]}
+vector は省略可（オフラインで vector 系の検索方式を評価する場合は必須）。
+
+オフライン（Azureリソースなし）:
+    python benchmarks/bench_retrieval.py --synthetic 200
+    python benchmarks/bench_retrieval.py --corpus chunks.jsonl --queries queries.jsonl
+オフラインのインデックスは benchmarks/offline_index.py を参照（semantic 系は評価できない）。
+
+Azure AI Search（.env の接続情報を使用）:
+    python benchmarks/bench_retrieval.py --live --queries queries.jsonl --write-env .env
+    python benchmarks/bench_retrieval.py --live --queries queries.jsonl --ef-search 100,500 --update-index <インデックス名>
+--live で --ef-search を指定すると、インデックスの ef_search を順に変更して計測し、終了時に元の値に戻す。
+計測中は本番の検索（エージェントの検索ツールを含む）にも変更後の値が適用され、プロセスが強制終了された場合は
+元に戻らないため、--update-index に対象のインデックス名を指定した場合のみ実行する。
+元の値は変更前に表示するので、戻らなかった場合は Tools/azure_aisearch_create_index.py の再実行などで復元する。
+"""
+
+import argparse
+import json
+import sys
+import pathlib
+import time
+
+# ルートディレクトリをパスに追加
+ROOT_DIR = pathlib.Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import config
+from retrieval import QUERY_TYPES, uses_vector
+from benchmarks.bench_research import summarize
+from benchmarks.offline_index import OFFLINE_QUERY_TYPES, OfflineIndex
+from benchmarks.synthetic_corpus import generate_retrieval_set
+
+
+# %%
+def load_jsonl(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_relevant(chunk: dict, relevant: set[str]) -> bool:
+    """
+    チャンクが正解か（チャンクIDまたはファイル名で判定）。
+    """
+    return chunk.get("id") in relevant or chunk.get("file_name") in relevant
+
+
+def score_ranking(chunks: list[dict], relevant: set[str]) -> tuple[float, float]:
+    """
+    1クエリの recall@k と逆順位（最初の正解の順位の逆数）を計算する。
+    """
+    found = set()
+    reciprocal_rank = 0.0
+    for rank, chunk in enumerate(chunks, start=1):
+        if not is_relevant(chunk, relevant):
+            continue
+        found.add(chunk["id"] if chunk.get("id") in relevant else chunk.get("file_name"))
+        if not reciprocal_rank:
+            reciprocal_rank = 1.0 / rank
+    # 正解のないクエリは main で除外しているため、relevant は空でない
+    return len(found) / len(relevant), reciprocal_rank
+
+
+# %%
+class OfflineBackend:
+    """
+    OfflineIndex を検索する評価用バックエンド。
+    """
+
+    name = "offline"
+
+    def __init__(self, index: OfflineIndex):
+        self.index = index
+        self.ef_search = config.AZURE_AI_SEARCH_EF_SEARCH
+
+    def supports(self, query_type: str) -> bool:
+        return query_type in OFFLINE_QUERY_TYPES and (self.index.has_vectors or not uses_vector(query_type))
+
+    def set_ef_search(self, ef_search: int | None) -> None:
+        self.ef_search = ef_search or config.AZURE_AI_SEARCH_EF_SEARCH
+
+    def search(self, query: str, query_type: str, top_k: int, vector: list[float] | None) -> list[dict]:
+        return self.index.search(query, query_type, top_k, vector=vector, ef_search=self.ef_search)
+
+    def close(self) -> None:
+        pass
+
+
+class LiveBackend:
+    """
+    Azure AI Search のインデックスを検索する評価用バックエンド。
+    ef_search を指定した場合はインデックスの HNSW の設定を変更し、close で元に戻す。
+    変更は本番の検索にもそのまま影響する。
+    """
+
+    name = "live"
+
+    def __init__(self):
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents import SearchClient
+        from azure.search.documents.indexes import SearchIndexClient
+        from openai import AzureOpenAI
+        from retrieval import SearchRetriever
+
+        if not (config.AZURE_AI_SEARCH_ENDPOINT and config.AZURE_AI_SEARCH_API_KEY and config.AZURE_AI_SEARCH_INDEX_NAME):
+            raise ValueError("AZURE_AI_SEARCH_ENDPOINT / API_KEY / INDEX_NAME を設定してください。")
+
+        credential = AzureKeyCredential(config.AZURE_AI_SEARCH_API_KEY)
+        embedding_client = None
+        if config.AZURE_OPENAI_API_ENDPOINT and config.AZURE_OPENAI_API_KEY:
+            embedding_client = AzureOpenAI(
+                azure_endpoint=config.AZURE_OPENAI_API_ENDPOINT,
+                api_key=config.AZURE_OPENAI_API_KEY,
+                api_version=config.AZURE_OPENAI_API_VERSION,
+            )
+        self.retriever = SearchRetriever(
+            SearchClient(
+                endpoint=config.AZURE_AI_SEARCH_ENDPOINT,
+                index_name=config.AZURE_AI_SEARCH_INDEX_NAME,
+                credential=credential,
+            ),
+            embedding_client,
+        )
+        self.index_client = SearchIndexClient(endpoint=config.AZURE_AI_SEARCH_ENDPOINT, credential=credential)
+        self._original_ef_search: dict[str, int] | None = None
+
+    def supports(self, query_type: str) -> bool:
+        if uses_vector(query_type) and self.retriever.embedding_client is None:
+            return False
+        return "semantic" not in query_type or bool(config.AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION)
+
+    def set_ef_search(self, ef_search: int | None) -> None:
+        if ef_search is None:
+            return
+        index = self.index_client.get_index(config.AZURE_AI_SEARCH_INDEX_NAME)
+        algorithms = [a for a in index.vector_search.algorithms if getattr(a, "parameters", None) is not None]
+        if self._original_ef_search is None:
+            self._original_ef_search = {a.name: a.parameters.ef_search for a in algorithms}
+            # 強制終了で close が呼ばれなかった場合に手動で戻せるよう、元の値を表示しておく
+            print(f"インデックス {config.AZURE_AI_SEARCH_INDEX_NAME} の ef_search を変更します（元の値: {self._original_ef_search}）")
+        for algorithm in algorithms:
+            algorithm.parameters.ef_search = ef_search
+        self.index_client.create_or_update_index(index)
+
+    def embed(self, text: str) -> list[float] | None:
+        return self.retriever.embed(text)
+
+    def search(self, query: str, query_type: str, top_k: int, vector: list[float] | None) -> list[dict]:
+        return self.retriever.search(query, query_type=query_type, top_k=top_k, vector=vector)
+
+    def close(self) -> None:
+        if self._original_ef_search is None:
+            return
+        index = self.index_client.get_index(config.AZURE_AI_SEARCH_INDEX_NAME)
+        for algorithm in index.vector_search.algorithms:
+            if algorithm.name in self._original_ef_search:
+                algorithm.parameters.ef_search = self._original_ef_search[algorithm.name]
+        self.index_client.create_or_update_index(index)
+        print("インデックスの ef_search を元に戻しました。")
+
+
+# %%
+def evaluate(backend, queries: list[dict], query_types: list[str], top_ks: list[int],
+             ef_searches: list[int | None]) -> list[dict]:
+    """
+    検索方式・取得件数・ef_search の組み合わせごとにクエリセットを実行する。
+    ef_search は vector 系の検索方式のみに影響するため、simple / semantic は1回だけ計測する。
+
+    Returns:
+        list[dict]: 組み合わせごとの結果（query_type, top_k, ef_search, recall, mrr, latency_ms）
+    """
+    results = []
+    for ef_search in ef_searches:
+        backend.set_ef_search(ef_search)
+        for query_type in query_types:
+            if not uses_vector(query_type) and ef_search != ef_searches[0]:
+                continue
+            for top_k in top_ks:
+                # 初回の接続確立などをレイテンシに含めないよう、1件を事前に実行する
+                backend.search(queries[0]["query"], query_type, top_k, queries[0].get("vector"))
+                recalls, reciprocal_ranks, latencies = [], [], []
+                for item in queries:
+                    started = time.perf_counter()
+                    chunks = backend.search(item["query"], query_type, top_k, item.get("vector"))
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    recall, reciprocal_rank = score_ranking(chunks, set(item["relevant"]))
+                    recalls.append(recall)
+                    reciprocal_ranks.append(reciprocal_rank)
+                results.append({
+                    "query_type": query_type,
+                    "top_k": top_k,
+                    "ef_search": ef_search if uses_vector(query_type) else None,
+                    "recall": sum(recalls) / len(recalls),
+                    "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks),
+                    "latency_ms": summarize(latencies),
+                })
+    return results
+
+
+def choose(results: list[dict], max_p95_ms: float | None, recall_tolerance: float) -> dict | None:
+    """
+    レイテンシの上限内で、再現率が最高値から recall_tolerance 以内の設定のうち
+    取得件数が最小（同数なら p95 が最小）のものを選ぶ。
+    取得件数が少ないほど Researcher に渡すトークン数が減るため、再現率が同程度なら小さい方を優先する。
+    """
+    candidates = [r for r in results if max_p95_ms is None or r["latency_ms"]["p95"] <= max_p95_ms]
+    if not candidates:
+        return None
+    best_recall = max(r["recall"] for r in candidates)
+    eligible = [r for r in candidates if r["recall"] >= best_recall - recall_tolerance]
+    return min(eligible, key=lambda r: (r["top_k"], r["latency_ms"]["p95"], -r["mrr"]))
+
+
+def write_env(path: str, chosen: dict) -> None:
+    """
+    選択した設定を .env に書き込む。
+    """
+    from dotenv import set_key
+
+    pathlib.Path(path).touch(exist_ok=True)
+    set_key(path, "RETRIEVAL_QUERY_TYPE", chosen["query_type"], quote_mode="never")
+    set_key(path, "RETRIEVAL_TOP_K", str(chosen["top_k"]), quote_mode="never")
+    if chosen["ef_search"] is not None:
+        set_key(path, "AZURE_AI_SEARCH_EF_SEARCH", str(chosen["ef_search"]), quote_mode="never")
+
+
+# %%
+def print_report(results: list[dict], chosen: dict | None, backend_name: str, queries: int) -> None:
+    print("=" * 78)
+    print(f"検索評価（{backend_name}、クエリ {queries} 件）")
+    print("=" * 78)
+    print(f"{'query_type':<24}{'top_k':>6}{'ef':>6}{'recall@k':>10}{'MRR':>8}{'p50 ms':>10}{'p95 ms':>10}")
+    for r in results:
+        ef_search = "-" if r["ef_search"] is None else str(r["ef_search"])
+        marker = " *" if r is chosen else ""
+        print(
+            f"{r['query_type']:<24}{r['top_k']:>6}{ef_search:>6}{r['recall']:>10.3f}{r['mrr']:>8.3f}"
+            f"{r['latency_ms']['p50']:>10.2f}{r['latency_ms']['p95']:>10.2f}{marker}"
+        )
+    if chosen is None:
+        print("\nレイテンシの上限を満たす設定がありません。")
+    else:
+        ef_search = "" if chosen["ef_search"] is None else f", ef_search={chosen['ef_search']}"
+        print(f"\n選択した設定（*）: query_type={chosen['query_type']}, top_k={chosen['top_k']}{ef_search}")
+
+
+def parse_ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+# %%
+def main() -> int:
+    parser = argparse.ArgumentParser(description="検索評価ベンチマーク")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", type=int, metavar="DOCUMENTS", help="合成データ（ファイル数）で評価する")
+    source.add_argument("--corpus", help="オフラインのインデックスに登録するチャンクのJSONL")
+    source.add_argument("--live", action="store_true", help="Azure AI Search のインデックスで評価する")
+    parser.add_argument("--queries", help="正解付きクエリセットのJSONL（--synthetic 以外で必須）")
+    parser.add_argument("--query-types", default=",".join(QUERY_TYPES), help="評価する検索方式（カンマ区切り）")
+    parser.add_argument("--top-k", default="3,5,10", help="評価する取得件数（カンマ区切り）")
+    parser.add_argument("--ef-search", help="評価する ef_search（カンマ区切り、--live では省略時に変更しない）")
+    parser.add_argument("--update-index", metavar="INDEX",
+                        help="--live で --ef-search を指定する場合に、本番のインデックスの設定を変更してよいことの確認として"
+                             "対象のインデックス名を指定する")
+    parser.add_argument("--max-p95-ms", type=float, help="選択する設定の p95 レイテンシの上限（ミリ秒）")
+    parser.add_argument("--recall-tolerance", type=float, default=0.01,
+                        help="最高の再現率からこの差以内なら取得件数の少ない設定を選ぶ")
+    parser.add_argument("--synthetic-queries", type=int, default=200, help="合成データのクエリ数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--output", help="結果を保存するJSON")
+    parser.add_argument("--write-env", metavar="PATH", help="選択した設定を書き込む .env のパス")
+    args = parser.parse_args()
+
+    if args.synthetic is None and not args.queries:
+        parser.error("--queries を指定してください。")
+    if args.live and args.ef_search and args.update_index != config.AZURE_AI_SEARCH_INDEX_NAME:
+        parser.error(
+            f"--live で --ef-search を指定すると、計測中は本番のインデックス（{config.AZURE_AI_SEARCH_INDEX_NAME}）の "
+            "ef_search が変更され、検索中のトラフィックにも影響します。実行する場合は --update-index にインデックス名を指定してください。"
+        )
+
+    if args.synthetic is not None:
+        chunks, queries = generate_retrieval_set(
+            documents=args.synthetic, queries=args.synthetic_queries, seed=args.seed
+        )
+        backend = OfflineBackend(OfflineIndex(chunks, seed=args.seed))
+    else:
+        queries = load_jsonl(args.queries)
+        skipped = [item for item in queries if not item.get("relevant")]
+        if skipped:
+            # recall を計算できないため、正解のないクエリは評価から除外する
+            print(f"[スキップ] 正解（relevant）のないクエリ {len(skipped)} 件: {skipped[0].get('query')!r} など")
+            queries = [item for item in queries if item.get("relevant")]
+        if not queries:
+            parser.error("正解付きのクエリがありません。")
+        backend = LiveBackend() if args.live else OfflineBackend(OfflineIndex(load_jsonl(args.corpus), seed=args.seed))
+    if not queries:
+        parser.error("クエリセットが空です。")
+
+    if args.ef_search:
+        ef_searches = parse_ints(args.ef_search)
+    else:
+        ef_searches = [None] if args.live else [16, 64, 256, config.AZURE_AI_SEARCH_EF_SEARCH]
+
+    query_types = []
+    for query_type in args.query_types.split(","):
+        query_type = query_type.strip()
+        if query_type not in QUERY_TYPES:
+            parser.error(f"未対応の検索方式です: {query_type}")
+        if not backend.supports(query_type):
+            print(f"[スキップ] {query_type}: このバックエンドでは評価できません。")
+            continue
+        query_types.append(query_type)
+    if not query_types:
+        parser.error("評価できる検索方式がありません。")
+
+    if isinstance(backend, LiveBackend) and any(uses_vector(t) for t in query_types):
+        # ベクトル化の時間を検索のレイテンシに含めないよう、クエリのベクトルを事前に計算する
+        for item in queries:
+            item["vector"] = item.get("vector") or backend.embed(item["query"])
+    elif any(uses_vector(t) for t in query_types) and not all(item.get("vector") for item in queries):
+        parser.error("オフラインで vector 系の検索方式を評価するには、全クエリに vector が必要です。")
+
+    try:
+        results = evaluate(backend, queries, query_types, parse_ints(args.top_k), ef_searches)
+    finally:
+        backend.close()
+
+    chosen = choose(results, args.max_p95_ms, args.recall_tolerance)
+    print_report(results, chosen, backend.name, len(queries))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "chosen": chosen}, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を保存しました: {args.output}")
+
+    if chosen is None:
+        return 1
+    if args.write_env:
+        write_env(args.write_env, chosen)
+        print(f"選択した設定を書き込みました: {args.write_env}（Tools/create_agents.py で使用）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
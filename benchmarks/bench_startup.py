@@ -0,0 +1,107 @@
+# %%
+"""
+起動時間ベンチマークスクリプト
+
+DeepResearchRunner のコールドスタートとウォームスタートの所要時間を計測する。
+
+- import: run_deep_research モジュールのインポート時間（新しいプロセスで計測）
+- cold: キャッシュなしでの初期化とエージェント取得
+- warm: エージェント情報のキャッシュがある状態での初期化とエージェント取得
+
+    python benchmarks/bench_startup.py --api-latency 0.2
+"""
+
+import argparse
+import contextlib
+import io
+import subprocess
+import sys
+import pathlib
+import time
+
+# ルートディレクトリをパスに追加
+ROOT_DIR = pathlib.Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from client_factory import AgentCache
+from run_deep_research import DeepResearchRunner
+from rate_limiter import RetryScheduler
+from benchmarks.bench_research import summarize
+from benchmarks.simulated_agents import SimulatedProjectClient, SimulationSettings
+
+
+# %%
+def measure_import(repeat: int) -> list[float]:
+    """
+    新しいプロセスで run_deep_research のインポート時間を計測する。
+    """
+    code = (
+        "import time; start = time.perf_counter(); import run_deep_research; "
+        "print(time.perf_counter() - start)"
+    )
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        results.append(float(output.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def measure_startup(client: SimulatedProjectClient, agent_cache: AgentCache) -> float:
+    """
+    Runner を生成してエージェント取得まで完了する時間を計測する。
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        runner = DeepResearchRunner(
+            client=client,
+            agent_ids=client.agent_ids,
+            scheduler=RetryScheduler(),
+            agent_cache=agent_cache,
+        )
+        runner.warm_up()
+    return time.perf_counter() - start
+
+
+# %%
+def main() -> int:
+    parser = argparse.ArgumentParser(description="起動時間ベンチマーク")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+    parser.add_argument("--api-latency", type=float, default=0.2,
+                        help="get_agent などのAPI呼び出しごとの遅延（秒）")
+    args = parser.parse_args()
+
+    client = SimulatedProjectClient(SimulationSettings(api_latency=args.api_latency))
+
+    imports = measure_import(args.repeat)
+    cold = []
+    warm = []
+    for _ in range(args.repeat):
+        cache = AgentCache(persist=False)
+        client.reset()
+        cold.append(measure_startup(client, cache))
+        cold_calls = client.get_agent_calls
+        warm.append(measure_startup(client, cache))
+        warm_calls = client.get_agent_calls - cold_calls
+
+    print("=" * 60)
+    print("起動時間ベンチマーク結果")
+    print("=" * 60)
+    print(f"API遅延: {args.api_latency * 1000:.0f}ms / 計測回数: {args.repeat}")
+    for name, values in (("import", imports), ("cold", cold), ("warm", warm)):
+        stats = summarize(values)
+        print(
+            f"  {name:<8} mean {stats['mean'] * 1000:8.1f}ms"
+            f"  p50 {stats['p50'] * 1000:8.1f}ms  p95 {stats['p95'] * 1000:8.1f}ms"
+        )
+    print(f"get_agent 呼び出し: cold {cold_calls} 回 / warm {warm_calls} 回")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+# %%
+"""
+ローカルモックサーバー
+
+データ取り込み（Tools/add_vector_index.py）で使用する以下のAPIをローカルで再現する:
+- Content Understanding: analyze（202 + Operation-Location）と結果のポーリング
+- Azure OpenAI: embeddings
+- Azure AI Search: ドキュメント検索（スキップ確認）とアップロード
+
+一定の確率で 429（Retry-After 付き）を返し、スロットリングを再現できる。
+統計情報は GET /_stats で取得できる。
+
+単体で起動する場合:
+    python benchmarks/mock_servers.py --port 8900 --throttle-rate 0.05
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+# %%
+@dataclass
+class MockSettings:
+    """
+    モックサーバーの挙動設定。
+
+    Attributes:
+        throttle_rate: 429 を返す確率（0.0〜1.0）
+        retry_after_ms: 429 応答に付与する待機時間（ミリ秒）
+        cu_polls: Content Understanding の結果が Succeeded になるまでのポーリング回数
+        latency: 各リクエストに加える遅延（秒）
+        dimensions: 返却するベクトルの次元数
+        seed: 乱数シード
+    """
+    throttle_rate: float = 0.0
+    retry_after_ms: int = 100
+    cu_polls: int = 1
+    latency: float = 0.0
+    dimensions: int = 3072
+    seed: int | None = None
+
+
+class MockState:
+    """
+    サーバー全体で共有する状態（解析中の操作と統計情報）。
+    """
+
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.rng = random.Random(settings.seed)
+        self.operations: dict[str, dict] = {}
+        self.ids = itertools.count(1)
+        self.requests = Counter()
+        self.throttled = Counter()
+        self.uploaded_documents = 0
+
+    def should_throttle(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.settings.throttle_rate
+
+
+def fake_embedding(text: str, dimensions: int) -> list[float]:
+    """
+    テキストから決定的なベクトルを生成する。
+    """
+    rng = random.Random(zlib.crc32(text.encode("utf-8")))
+    return [rng.uniform(-1.0, 1.0) for _ in range(dimensions)]
+
+
+# %%
+class MockAzureHandler(BaseHTTPRequestHandler):
+    """
+    パスに応じて各APIの応答を返すリクエストハンドラ。
+    """
+
+    server_version = "MockAzure/1.0"
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文の分割送信でNagle遅延が発生しないようにする
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        # 標準エラー出力へのアクセスログは抑制する
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status: int, payload, headers: dict[str, str] | None = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self) -> str:
+        path = urlparse(self.path).path
+        if path == "/_stats":
+            return "stats"
+        if path.startswith("/contentunderstanding/analyzers/") and path.endswith(":analyze"):
+            return "cu_analyze"
+        if path.startswith("/contentunderstanding/analyzerResults/"):
+            return "cu_result"
+        if path.endswith("/embeddings"):
+            return "embeddings"
+        if "/docs/search.index" in path or path.endswith("/docs/index"):
+            return "search_upload"
+        if "/docs/search" in path:
+            return "search_query"
+        return "unknown"
+
+    def _handle(self, method: str) -> None:
+        route = self._route()
+        body = self._read_body()
+
+        if route == "stats":
+            self._send_json(200, self._stats())
+            return
+
+        with self.state.lock:
+            self.state.requests[route] += 1
+
+        if self.state.settings.latency > 0:
+            time.sleep(self.state.settings.latency)
+
+        if route != "unknown" and self.state.should_throttle():
+            with self.state.lock:
+                self.state.throttled[route] += 1
+            retry_after_ms = self.state.settings.retry_after_ms
+            headers = {"retry-after-ms": str(retry_after_ms)}
+            # Retry-After は秒単位のため、1秒未満の待機はミリ秒ヘッダーのみで通知する
+            if retry_after_ms >= 1000:
+                headers["Retry-After"] = str(round(retry_after_ms / 1000))
+            self._send_json(
+                429,
+                {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                headers=headers,
+            )
+            return
+
+        handler = getattr(self, f"_{route}", None)
+        if handler is None:
+            self._send_json(404, {"error": {"code": "NotFound", "message": self.path}})
+            return
+        handler(method, body)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    # %%
+    def _stats(self) -> dict:
+        with self.state.lock:
+            return {
+                "requests": dict(self.state.requests),
+                "throttled": dict(self.state.throttled),
+                "uploaded_documents": self.state.uploaded_documents,
+                "pending_operations": len(self.state.operations),
+            }
+
+    def _cu_analyze(self, method: str, body: bytes) -> None:
+        # 合成コーパスはMarkdownテキストなので、アップロードされた内容をそのまま解析結果とする
+        with self.state.lock:
+            operation_id = f"op-{next(self.state.ids)}"
+            self.state.operations[operation_id] = {
+                "markdown": body.decode("utf-8", errors="replace"),
+                "polls": 0,
+            }
+        host = self.headers.get("Host")
+        location = f"http://{host}/contentunderstanding/analyzerResults/{operation_id}?api-version=mock"
+        self._send_json(202, {"id": operation_id, "status": "Running"},
+                        headers={"Operation-Location": location})
+
+    def _cu_result(self, method: str, body: bytes) -> None:
+        operation_id = urlparse(self.path).path.rsplit("/", 1)[-1]
+        with self.state.lock:
+            operation = self.state.operations.get(operation_id)
+            if operation is None:
+                payload = None
+            else:
+                operation["polls"] += 1
+                if operation["polls"] < self.state.settings.cu_polls:
+                    payload = {"id": operation_id, "status": "Running"}
+                else:
+                    del self.state.operations[operation_id]
+                    payload = {
+                        "id": operation_id,
+                        "status": "Succeeded",
+                        "result": {"contents": [{"markdown": operation["markdown"]}]},
+                    }
+        if payload is None:
+            self._send_json(404, {"error": {"code": "NotFound", "message": operation_id}})
+        else:
+            self._send_json(200, payload)
+
+    def _embeddings(self, method: str, body: bytes) -> None:
+        request = json.loads(body or b"{}")
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = self.state.settings.dimensions
+        data = [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimensions)}
+            for i, text in enumerate(inputs)
+        ]
+        tokens = sum(len(text) for text in inputs) // 4
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "mock-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _search_query(self, method: str, body: bytes) -> None:
+        # スキップ確認用：常に未登録として応答する
+        self._send_json(200, {"value": []})
+
+    def _search_upload(self, method: str, body: bytes) -> None:
+        documents = json.loads(body or b"{}").get("value", [])
+        with self.state.lock:
+            self.state.uploaded_documents += len(documents)
+        self._send_json(200, {"value": [
+            {"key": doc.get("id"), "status": True, "errorMessage": None, "statusCode": 201}
+            for doc in documents
+        ]})
+
+
+# %%
+class MockAzureServer(ThreadingHTTPServer):
+    """
+    モックAPIを提供するHTTPサーバー。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, settings: MockSettings | None = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), MockAzureHandler)
+        self.state = MockState(settings or MockSettings())
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve(settings: MockSettings, port_queue=None, port: int = 0) -> None:
+    """
+    モックサーバーを起動する（別プロセスからの起動用）。
+
+    Args:
+        settings: モックサーバーの設定
+        port_queue: 起動後に待ち受けポートを通知するキュー
+        port: 待ち受けポート（0 の場合は空きポート）
+    """
+    server = MockAzureServer(settings, port=port)
+    if port_queue is not None:
+        port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+# %%
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Azure API モックサーバー")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after-ms", type=int, default=100)
+    parser.add_argument("--cu-polls", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--dimensions", type=int, default=3072)
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        throttle_rate=args.throttle_rate,
+        retry_after_ms=args.retry_after_ms,
+        cu_polls=args.cu_polls,
+        latency=args.latency,
+        dimensions=args.dimensions,
+    )
+    print(f"モックサーバーを起動します: http://127.0.0.1:{args.port}")
+    serve(settings, port=args.port)
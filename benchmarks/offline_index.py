@@ -0,0 +1,186 @@
+# %%
+"""
+オフライン検索インデックス
+
+Azure AI Search の検索方式をローカルで再現し、検索評価をAzureリソースなしで実行する。
+
+- simple: 文字バイグラムの BM25（日本語を分かち書きせずに検索するため）
+- vector: k近傍グラフ上のビームサーチ。HNSW の最下層と同様に、ef_search を
+  大きくするほど再現率が上がり、レイテンシが増える
+- vector_simple_hybrid: simple と vector の結果を RRF（Reciprocal Rank Fusion）で統合
+
+semantic 系の検索方式はセマンティックランカーが必要なため、オフラインでは使用できない。
+"""
+
+import heapq
+import math
+import random
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from retrieval import normalize_query
+
+
+OFFLINE_QUERY_TYPES = ["simple", "vector", "vector_simple_hybrid"]
+
+# RRF の定数と、統合する各方式の候補数（Azure AI Search のハイブリッド検索と同じ値）
+RRF_K = 60
+HYBRID_CANDIDATES = 50
+
+
+def bigrams(text: str) -> list[str]:
+    """
+    正規化したテキストを文字バイグラムに分割する。
+    """
+    text = normalize_query(text).replace(" ", "")
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+# %%
+class OfflineIndex:
+    """
+    チャンク（id, content, file_name, file_id, chunk_no, content_vector）を保持するローカルインデックス。
+    """
+
+    def __init__(self, chunks: list[dict], m: int = 4, seed: int = 0, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            chunks: インデックスに登録するチャンク
+            m: グラフの各ノードの近傍数（HNSW の m。最下層と同じく 2m 本の辺を張る）
+            seed: 探索開始点の選択に使用する乱数シード
+            k1: BM25 のパラメータ
+            b: BM25 のパラメータ
+        """
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self._build_text_index()
+
+        self.vectors = None
+        if chunks and all(c.get("content_vector") for c in chunks):
+            self._build_graph(m, seed)
+
+    @property
+    def has_vectors(self) -> bool:
+        return self.vectors is not None
+
+    # %%
+    def _build_text_index(self) -> None:
+        self.postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self.lengths = []
+        for index, chunk in enumerate(self.chunks):
+            terms = Counter(bigrams(chunk.get("content") or ""))
+            self.lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                self.postings[term].append((index, count))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def _build_graph(self, m: int, seed: int) -> None:
+        vectors = np.asarray([c["content_vector"] for c in self.chunks], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.where(norms > 0, norms, 1.0)
+
+        count = len(self.chunks)
+        degree = min(count - 1, 2 * m)
+        neighbors: list[set[int]] = [set() for _ in range(count)]
+        # 類似度行列は行ブロックごとに計算してメモリ使用量を抑える
+        for start in range(0, count, 1024):
+            block = self.vectors[start:start + 1024] @ self.vectors.T
+            for offset, row in enumerate(block):
+                node = start + offset
+                row[node] = -np.inf
+                nearest = np.argpartition(-row, degree)[:degree] if degree > 0 else []
+                for other in nearest:
+                    neighbors[node].add(int(other))
+                    neighbors[int(other)].add(node)
+        self.graph = [np.fromiter(n, dtype=np.int64) for n in neighbors]
+
+        # 上位層の代わりに、少数の開始点から最も近いものを探索の起点にする
+        rng = random.Random(seed)
+        self.entry_points = np.asarray(rng.sample(range(count), max(1, int(math.sqrt(count)))))
+
+    # %%
+    def search_text(self, query: str, top: int) -> list[tuple[int, float]]:
+        """
+        BM25 で検索し、(チャンクの位置, スコア) を返す。
+        """
+        scores: dict[int, float] = defaultdict(float)
+        total = len(self.chunks)
+        for term in set(bigrams(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, count in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / self.average_length)
+                scores[index] += idf * count * (self.k1 + 1) / (count + norm)
+        return heapq.nlargest(top, scores.items(), key=lambda item: item[1])
+
+    def search_vector(self, vector: list[float], top: int, ef_search: int) -> list[tuple[int, float]]:
+        """
+        近傍グラフ上のビームサーチで検索し、(チャンクの位置, コサイン類似度) を返す。
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        ef = max(ef_search, top)
+
+        entry_scores = self.vectors[self.entry_points] @ query
+        entry = int(self.entry_points[int(np.argmax(entry_scores))])
+        entry_score = float(entry_scores.max())
+
+        visited = {entry}
+        candidates = [(-entry_score, entry)]
+        results = [(entry_score, entry)]
+        while candidates:
+            negative, node = heapq.heappop(candidates)
+            if len(results) >= ef and -negative < results[0][0]:
+                break
+            unvisited = [n for n in self.graph[node].tolist() if n not in visited]
+            if not unvisited:
+                continue
+            visited.update(unvisited)
+            for other, score in zip(unvisited, (self.vectors[unvisited] @ query).tolist()):
+                if len(results) < ef or score > results[0][0]:
+                    heapq.heappush(candidates, (-score, other))
+                    heapq.heappush(results, (score, other))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return [(index, score) for score, index in heapq.nlargest(top, results)]
+
+    def search(self, query: str, query_type: str, top: int, vector: list[float] | None = None,
+               ef_search: int = 500) -> list[dict]:
+        """
+        SearchRetriever.search と同じ形式でチャンクを返す。
+        """
+        if query_type not in OFFLINE_QUERY_TYPES:
+            raise ValueError(f"オフラインでは未対応の検索方式です: {query_type}")
+        if query_type != "simple" and (vector is None or not self.has_vectors):
+            raise ValueError("vector 系の検索方式にはクエリとチャンクのベクトルが必要です。")
+
+        if query_type == "simple":
+            ranked = self.search_text(query, top)
+        elif query_type == "vector":
+            ranked = self.search_vector(vector, top, ef_search)
+        else:
+            # ハイブリッド検索: 各方式の上位の候補を RRF で統合する
+            depth = max(top, HYBRID_CANDIDATES)
+            fused: dict[int, float] = defaultdict(float)
+            for results in (self.search_text(query, depth), self.search_vector(vector, depth, ef_search)):
+                for rank, (index, _) in enumerate(results):
+                    fused[index] += 1.0 / (RRF_K + rank + 1)
+            ranked = heapq.nlargest(top, fused.items(), key=lambda item: item[1])
+
+        return [
+            {
+                "id": self.chunks[index]["id"],
+                "content": self.chunks[index].get("content"),
+                "file_name": self.chunks[index].get("file_name"),
+                "file_id": self.chunks[index].get("file_id"),
+                "chunk_no": self.chunks[index].get("chunk_no"),
+                "score": score,
+            }
+            for index, score in ranked
+        ]
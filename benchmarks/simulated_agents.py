@@ -0,0 +1,430 @@
+# %%
+"""
+シミュレーション用 Agents バックエンド
+
+DeepResearchRunner が使用する AIProjectClient.agents の一部
+（threads / messages / runs / get_agent）をローカルで再現する。
+Azureリソースなしでスループットやレイテンシの回帰を計測するために使用する。
+"""
+
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+from retrieval import normalize_query
+
+
+# %%
+# Researcher の応答に必ず含まれるマーカー（入力中の調査結果数の推定に使用）
+FINDINGS_MARKER = "query_id"
+
+PLANNER_RESPONSE = {
+    "original_question": "シミュレーション質問",
+    "analysis": "シミュレーション用の分析結果",
+    "sub_queries": [
+        {"id": 1, "query": "製品の概要", "purpose": "全体像の把握"},
+        {"id": 2, "query": "導入事例", "purpose": "具体例の収集"},
+        {"id": 3, "query": "制約事項", "purpose": "注意点の確認"},
+    ],
+}
+
+# 2回目以降の計画: 完全一致・表記ゆれ・類似・新規のサブクエリを含む
+FOLLOWUP_PLANNER_RESPONSE = {
+    "original_question": "シミュレーション質問",
+    "analysis": "不足している情報の分析結果",
+    "sub_queries": [
+        {"id": 1, "query": "製品の概要", "purpose": "全体像の再確認"},
+        {"id": 2, "query": "導入 事例！", "purpose": "具体例の追加収集"},
+        {"id": 3, "query": "主な制約事項", "purpose": "注意点の詳細"},
+        {"id": 4, "query": "価格体系", "purpose": "費用の確認"},
+    ],
+}
+
+RESEARCHER_FINDING = {
+    "content": "シミュレーションで生成された調査結果の要約です。" * 4,
+    "source": "simulated-document.pdf",
+    "relevance": "高",
+}
+
+
+def _code_block(payload: dict) -> str:
+    """
+    エージェントと同じくJSONをマークダウンのコードブロックで囲む。
+    """
+    return "```json\n" + json.dumps(payload, ensure_ascii=False, indent=2) + "\n```"
+
+
+# %%
+@dataclass
+class LatencyModel:
+    """
+    エージェント実行時間の分布（正規分布を下限でクリップ）。
+    """
+    mean: float = 0.05
+    stddev: float = 0.01
+    minimum: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        """
+        実行時間（秒）を1つサンプリングする。
+        """
+        return max(self.minimum, rng.gauss(self.mean, self.stddev))
+
+
+@dataclass
+class CallRecord:
+    """
+    1回のエージェント実行の記録。
+    """
+    stage: str
+    iteration: int | None
+    prompt_chars: int
+    response_chars: int
+    latency: float
+    status: str
+
+
+@dataclass
+class SimulationSettings:
+    """
+    シミュレーションの挙動設定。
+
+    Attributes:
+        latency: ステージ名（planner/researcher/critic/report）ごとの実行時間分布
+        api_latency: threads/messages 等の各API呼び出しに加える固定遅延（秒）
+        failure_rate: 実行が失敗する確率（0.0〜1.0）
+        failure_code: 失敗時に last_error.code に設定するコード
+        complete_after: Critic が COMPLETE を返すまでに必要な調査結果の件数
+        findings_per_response: Researcher の応答に含める findings の件数
+        responses: ステージ名ごとの応答テキストの上書き
+        seed: 乱数シード
+    """
+    latency: dict[str, LatencyModel] = field(default_factory=dict)
+    api_latency: float = 0.0
+    failure_rate: float = 0.0
+    failure_code: str = "server_error"
+    complete_after: int = 2
+    findings_per_response: int = 3
+    responses: dict[str, str] = field(default_factory=dict)
+    seed: int | None = None
+
+
+# %%
+class _Threads:
+    def __init__(self, backend: "SimulatedProjectClient"):
+        self._backend = backend
+
+    def create(self, **kwargs):
+        return self._backend._create_thread()
+
+
+class _Messages:
+    def __init__(self, backend: "SimulatedProjectClient"):
+        self._backend = backend
+
+    def create(self, thread_id: str, role: str, content: str, **kwargs):
+        return self._backend._add_message(thread_id, role, content)
+
+    def get_last_message_text_by_role(self, thread_id: str, role: str, **kwargs):
+        return self._backend._last_message(thread_id, role)
+
+
+class _Runs:
+    def __init__(self, backend: "SimulatedProjectClient"):
+        self._backend = backend
+
+    def create(self, thread_id: str, agent_id: str, **kwargs):
+        return self._backend._create_run(thread_id, agent_id)
+
+    def get(self, thread_id: str, run_id: str, **kwargs):
+        return self._backend._get_run(thread_id, run_id)
+
+
+class _Agents:
+    def __init__(self, backend: "SimulatedProjectClient"):
+        self._backend = backend
+        self.threads = _Threads(backend)
+        self.messages = _Messages(backend)
+        self.runs = _Runs(backend)
+
+    def get_agent(self, agent_id: str, **kwargs):
+        return self._backend._get_agent(agent_id)
+
+
+# %%
+class SimulatedProjectClient:
+    """
+    AIProjectClient の代替となるシミュレーションクライアント。
+
+    DeepResearchRunner(client=..., agent_ids=client.agent_ids) のように渡して使用する。
+    実行ごとの記録は records に蓄積される。
+    """
+
+    ROLES = {
+        "sim-planner": "planner",
+        "sim-researcher": "researcher",
+        "sim-critic": "critic",
+    }
+
+    def __init__(self, settings: SimulationSettings | None = None):
+        """
+        Args:
+            settings: シミュレーション設定（省略時は既定値）
+        """
+        self.settings = settings or SimulationSettings()
+        self.agents = _Agents(self)
+        self.agent_ids = {
+            "PLANNER_AGENT_ID": "sim-planner",
+            "RESEARCHER_AGENT_ID": "sim-researcher",
+            "CRITIC_AGENT_ID": "sim-critic",
+        }
+        self.records: list[CallRecord] = []
+        self.get_agent_calls = 0
+
+        self._rng = random.Random(self.settings.seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads: dict[str, list[SimpleNamespace]] = {}
+        self._runs: dict[str, dict] = {}
+
+    # %%
+    def reset(self) -> None:
+        """
+        記録とスレッド・実行の状態を破棄する。
+        """
+        with self._lock:
+            self.records.clear()
+            self.get_agent_calls = 0
+            self._threads.clear()
+            self._runs.clear()
+
+    def _api_call(self) -> None:
+        if self.settings.api_latency > 0:
+            time.sleep(self.settings.api_latency)
+
+    def _get_agent(self, agent_id: str):
+        self._api_call()
+        if agent_id not in self.ROLES:
+            raise ValueError(f"Unknown agent id: {agent_id}")
+        with self._lock:
+            self.get_agent_calls += 1
+        return SimpleNamespace(id=agent_id, name=f"Simulated-{self.ROLES[agent_id]}")
+
+    def _create_thread(self):
+        self._api_call()
+        with self._lock:
+            thread_id = f"thread_{next(self._ids)}"
+            self._threads[thread_id] = []
+        return SimpleNamespace(id=thread_id)
+
+    def _add_message(self, thread_id: str, role: str, content: str):
+        self._api_call()
+        message = SimpleNamespace(role=str(role), content=content)
+        with self._lock:
+            self._threads[thread_id].append(message)
+        return message
+
+    def _last_message(self, thread_id: str, role: str):
+        self._api_call()
+        with self._lock:
+            messages = [m for m in self._threads[thread_id] if m.role == str(role)]
+        if not messages:
+            return None
+        return SimpleNamespace(text=SimpleNamespace(value=messages[-1].content))
+
+    # %%
+    def _create_run(self, thread_id: str, agent_id: str):
+        self._api_call()
+        with self._lock:
+            prompt = self._threads[thread_id][-1].content
+            stage = self._stage(agent_id, prompt)
+            latency_model = self.settings.latency.get(stage, LatencyModel())
+            latency = latency_model.sample(self._rng)
+            failed = self._rng.random() < self.settings.failure_rate
+            run_id = f"run_{next(self._ids)}"
+            self._runs[run_id] = {
+                "thread_id": thread_id,
+                "stage": stage,
+                "prompt": prompt,
+                "started": time.perf_counter(),
+                "latency": latency,
+                "failed": failed,
+                "status": "queued",
+            }
+        return self._run_view(run_id)
+
+    def _get_run(self, thread_id: str, run_id: str):
+        self._api_call()
+        with self._lock:
+            run = self._runs[run_id]
+            if run["status"] in ("queued", "in_progress"):
+                elapsed = time.perf_counter() - run["started"]
+                if elapsed < run["latency"]:
+                    run["status"] = "in_progress"
+                else:
+                    self._finish_run(run, elapsed)
+        return self._run_view(run_id)
+
+    def _finish_run(self, run: dict, elapsed: float) -> None:
+        prompt = run["prompt"]
+        iteration = self._iteration(run["stage"], prompt)
+        if run["failed"]:
+            run["status"] = "failed"
+            response = ""
+        else:
+            run["status"] = "completed"
+            response = self._respond(run["stage"], prompt)
+            self._threads[run["thread_id"]].append(
+                SimpleNamespace(role="assistant", content=response)
+            )
+        self.records.append(CallRecord(
+            stage=run["stage"],
+            iteration=iteration,
+            prompt_chars=len(prompt),
+            response_chars=len(response),
+            latency=elapsed,
+            status=run["status"],
+        ))
+
+    def _run_view(self, run_id: str):
+        run = self._runs[run_id]
+        last_error = None
+        if run["status"] == "failed":
+            last_error = SimpleNamespace(
+                code=self.settings.failure_code,
+                message="Simulated failure",
+            )
+        return SimpleNamespace(id=run_id, status=run["status"], last_error=last_error)
+
+    # %%
+    def _stage(self, agent_id: str, prompt: str) -> str:
+        role = self.ROLES[agent_id]
+        if role == "planner" and "最終レポートを作成" in prompt:
+            return "report"
+        return role
+
+    def _iteration(self, stage: str, prompt: str) -> int | None:
+        """
+        入力に含まれる調査結果の件数からイテレーション番号を推定する。
+        """
+        findings = prompt.count(FINDINGS_MARKER)
+        if stage == "planner":
+            return findings + 1
+        if stage == "critic":
+            return findings
+        return None
+
+    def _respond(self, stage: str, prompt: str) -> str:
+        if stage in self.settings.responses:
+            return self.settings.responses[stage]
+        if stage == "planner":
+            if prompt.count(FINDINGS_MARKER) > 0:
+                return _code_block(FOLLOWUP_PLANNER_RESPONSE)
+            return _code_block(PLANNER_RESPONSE)
+        if stage == "researcher":
+            return _code_block({
+                FINDINGS_MARKER: 1,
+                "query": "製品の概要",
+                "findings": [RESEARCHER_FINDING] * self.settings.findings_per_response,
+                "summary": "シミュレーションの要約",
+            })
+        if stage == "critic":
+            findings = prompt.count(FINDINGS_MARKER)
+            if findings >= self.settings.complete_after:
+                return _code_block({
+                    "decision": "COMPLETE",
+                    "final_report": f"シミュレーションの最終レポート（調査結果 {findings} 件）",
+                })
+            return _code_block({
+                "decision": "NEED_MORE_RESEARCH",
+                "additional_queries": [{"query": "追加クエリ", "reason": "情報不足"}],
+            })
+        return "シミュレーションの最終レポート"
+
+
+# %%
+# シミュレーションで同じ意味とみなすクエリ（正規化後の表記 → 代表表記）
+SIMILAR_QUERIES = {
+    "主な制約事項": "制約事項",
+}
+
+
+class SimulatedRetriever:
+    """
+    SearchRetriever の代替となるシミュレーション用の検索。
+
+    クエリごとに決まったチャンクを返し、検索回数を search_calls に記録する。
+    ベクトルは文字の出現頻度から作るため、SIMILAR_QUERIES に登録したクエリ同士は
+    類似度が高くなる。検索結果は同じファイルの隣接チャンクが並ぶため、
+    チャンクのベクトル（content_vector）も同じファイル内では類似度が高くなる。
+    """
+
+    def __init__(self, query_type: str = "simple", top_k: int = 5, pool_size: int = 48,
+                 chunks_per_file: int = 6, latency: float = 0.0, chunk_chars: int = 400):
+        """
+        Args:
+            query_type: 検索方式（メモのキーに使用）
+            top_k: 1回の検索で返すチャンク数
+            pool_size: インデックス内のチャンク数（クエリ間で結果が重複する）
+            chunks_per_file: 1ファイルあたりのチャンク数
+            latency: 1回の検索にかかる時間（秒）
+            chunk_chars: チャンク本文の文字数
+        """
+        self.query_type = query_type
+        self.top_k = top_k
+        self.pool_size = pool_size
+        self.chunks_per_file = chunks_per_file
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.search_calls = 0
+        self.embed_calls = 0
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> list[float]:
+        with self._lock:
+            self.embed_calls += 1
+        normalized = normalize_query(text)
+        canonical = SIMILAR_QUERIES.get(normalized, normalized)
+        vector = [0.0] * 64
+        for weight, source in ((1.0, canonical), (0.1, normalized)):
+            for char in source:
+                vector[int(hashlib.md5(char.encode("utf-8")).hexdigest(), 16) % 64] += weight
+        return vector
+
+    def search(self, query: str, query_type: str | None = None, top_k: int | None = None,
+               vector: list[float] | None = None, select: list[str] | None = None) -> list[dict]:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self._lock:
+            self.search_calls += 1
+        normalized = normalize_query(query)
+        offset = int(hashlib.md5(SIMILAR_QUERIES.get(normalized, normalized).encode("utf-8")).hexdigest(), 16)
+        chunks = []
+        for rank in range(top_k or self.top_k):
+            number = (offset + rank) % self.pool_size
+            file_no, chunk_no = divmod(number, self.chunks_per_file)
+            chunk = {
+                "id": f"sim-chunk-{number}",
+                "content": f"チャンク {number} の本文。".ljust(self.chunk_chars, "…"),
+                "file_name": f"simulated-{file_no}.pdf",
+                "file_id": f"file-{file_no}",
+                "chunk_no": chunk_no,
+                "score": 1.0 / (rank + 1),
+            }
+            if select and "content_vector" in select:
+                chunk["content_vector"] = self._chunk_vector(file_no, chunk_no)
+            chunks.append(chunk)
+        return chunks
+
+    def _chunk_vector(self, file_no: int, chunk_no: int) -> list[float]:
+        """
+        ファイル共通の成分に、チャンクごとの小さな成分を加えたベクトル。
+        """
+        base = random.Random(f"file-{file_no}")
+        own = random.Random(f"chunk-{file_no}-{chunk_no}")
+        return [base.gauss(0, 1) + 0.4 * own.gauss(0, 1) for _ in range(64)]
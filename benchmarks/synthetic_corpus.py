@@ -0,0 +1,184 @@
+# %%
+"""
+合成コーパス生成モジュール
+
+データ取り込みのベンチマーク用に、見出し付きMarkdownのファイルを大量に生成する。
+セクション数とセクションあたりの文字数は範囲で指定できる。
+検索評価のベンチマーク用に、ベクトル付きのチャンクと正解付きのクエリも生成できる。
+
+単体で実行する場合:
+    python benchmarks/synthetic_corpus.py --output corpus --documents 10000
+"""
+
+import argparse
+import math
+import os
+import random
+from dataclasses import dataclass
+
+
+# %%
+WORDS = [
+    "クラウド", "検索", "インデックス", "ベクトル", "エージェント", "評価", "設計",
+    "運用", "監視", "セキュリティ", "コスト", "性能", "可用性", "データ", "モデル",
+    "要件", "構成", "手順", "制約", "結果",
+]
+
+# チャンク固有の用語（型番）を作るための音節
+SYLLABLES = [
+    "ア", "カ", "サ", "タ", "ナ", "ハ", "マ", "ヤ", "ラ", "ワ", "イ", "キ", "シ", "チ", "ニ",
+    "ヒ", "ミ", "リ", "ウ", "ク", "ス", "ツ", "ヌ", "フ", "ム", "ユ", "ル", "エ", "ケ", "セ",
+    "テ", "ネ", "ヘ", "メ", "レ", "オ", "コ", "ソ", "ト", "ノ",
+]
+
+
+@dataclass
+class CorpusSpec:
+    """
+    生成するコーパスの仕様。
+
+    Attributes:
+        documents: 生成するファイル数
+        sections: セクション数の範囲（最小, 最大）
+        section_chars: セクション本文の文字数の範囲（最小, 最大）
+        extension: ファイル拡張子（取り込み対象の拡張子に合わせる）
+        seed: 乱数シード
+    """
+    documents: int = 1000
+    sections: tuple[int, int] = (3, 10)
+    section_chars: tuple[int, int] = (200, 2000)
+    extension: str = ".pdf"
+    seed: int = 0
+
+
+def generate_document(rng: random.Random, spec: CorpusSpec, index: int) -> str:
+    """
+    1つのMarkdownドキュメントを生成する。
+    """
+    lines = [f"# 合成ドキュメント {index}"]
+    for section in range(rng.randint(*spec.sections)):
+        lines.append(f"\n## セクション {section + 1}\n")
+        target = rng.randint(*spec.section_chars)
+        paragraph = []
+        length = 0
+        while length < target:
+            word = rng.choice(WORDS)
+            paragraph.append(word)
+            length += len(word)
+        lines.append("".join(paragraph))
+    return "\n".join(lines) + "\n"
+
+
+def _noisy(rng: random.Random, base: list[float], scale: float) -> list[float]:
+    vector = [x + rng.gauss(0.0, scale) for x in base]
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def generate_retrieval_set(documents: int = 200, chunks_per_document: int = 6, queries: int = 200,
+                           dimensions: int = 64, paraphrase_ratio: float = 0.5,
+                           seed: int = 0) -> tuple[list[dict], list[dict]]:
+    """
+    検索評価用のチャンクと正解付きクエリを生成する。
+
+    各チャンクは固有の用語（型番）を含み、ベクトルはファイルごとの話題ベクトルの近くに置く。
+    クエリの一部は型番を含まない言い換えで、キーワード検索では見つからずベクトル検索でのみ見つかる。
+
+    Args:
+        documents: ファイル数
+        chunks_per_document: 1ファイルあたりのチャンク数
+        queries: クエリ数
+        dimensions: ベクトルの次元数
+        paraphrase_ratio: 言い換えクエリの割合
+        seed: 乱数シード
+
+    Returns:
+        tuple[list[dict], list[dict]]: チャンク（id, content, file_name, file_id, chunk_no, content_vector）と
+            クエリ（query, vector, relevant）
+    """
+    rng = random.Random(seed)
+    chunks = []
+    terms = set()
+    for doc in range(documents):
+        topic = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+        for chunk_no in range(chunks_per_document):
+            term = ""
+            while not term or term in terms:
+                term = "".join(rng.choices(SYLLABLES, k=5))
+            terms.add(term)
+            body = "".join(rng.choice(WORDS) for _ in range(rng.randint(60, 120)))
+            chunks.append({
+                "id": f"doc{doc:05d}_{chunk_no}",
+                "content": f"型番{term}の{rng.choice(WORDS)}について。{body}",
+                "file_name": f"doc_{doc:05d}.pdf",
+                "file_id": f"file-{doc:05d}",
+                "chunk_no": chunk_no,
+                "content_vector": _noisy(rng, topic, 0.8),
+                "term": term,
+            })
+
+    labeled = []
+    for _ in range(queries):
+        target = rng.choice(chunks)
+        # 型番を含むクエリはベクトルでは意味を捉えにくいため、ベクトルのずれを大きくする
+        if rng.random() < paraphrase_ratio:
+            text = f"{rng.choice(WORDS)}の{rng.choice(WORDS)}に関する記載は？"
+            scale = 0.08
+        else:
+            text = f"型番{target['term']}の{rng.choice(WORDS)}は？"
+            scale = 0.16
+        labeled.append({
+            "query": text,
+            "vector": _noisy(rng, target["content_vector"], scale),
+            "relevant": [target["id"]],
+        })
+    for chunk in chunks:
+        del chunk["term"]
+    return chunks, labeled
+
+
+def generate_corpus(directory: str, spec: CorpusSpec):
+    """
+    コーパスをディレクトリに書き出し、生成したファイルのパスを順に返す。
+
+    モックの Content Understanding はアップロードされた内容をそのまま
+    Markdownとして扱うため、拡張子に関わらず中身はMarkdownテキストになる。
+
+    Args:
+        directory: 出力先ディレクトリ
+        spec: コーパスの仕様
+
+    Yields:
+        str: 生成したファイルのパス
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(spec.seed)
+    for index in range(spec.documents):
+        path = os.path.join(directory, f"doc_{index:06d}{spec.extension}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(generate_document(rng, spec, index))
+        yield path
+
+
+# %%
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合成コーパス生成")
+    parser.add_argument("--output", required=True, help="出力先ディレクトリ")
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--min-sections", type=int, default=3)
+    parser.add_argument("--max-sections", type=int, default=10)
+    parser.add_argument("--min-section-chars", type=int, default=200)
+    parser.add_argument("--max-section-chars", type=int, default=2000)
+    parser.add_argument("--extension", default=".pdf")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    spec = CorpusSpec(
+        documents=args.documents,
+        sections=(args.min_sections, args.max_sections),
+        section_chars=(args.min_section_chars, args.max_section_chars),
+        extension=args.extension,
+        seed=args.seed,
+    )
+    count = sum(1 for _ in generate_corpus(args.output, spec))
+    print(f"{count} 件のファイルを生成しました: {args.output}")
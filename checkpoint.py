@@ -0,0 +1,90 @@
+# %%
+"""
+チェックポイント管理モジュール
+
+Deep Researchのセッション状態（計画・調査結果・評価・スレッドID・検索済みクエリ）を
+ステージごとにファイルへ保存し、失敗後に途中から再開できるようにする。
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import config
+
+
+# %%
+def make_session_id(question: str) -> str:
+    """
+    質問文からセッションIDを生成する（同じ質問は同じセッションとして再開される）。
+    """
+    return hashlib.sha256(question.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def new_session_state(session_id: str, question: str) -> dict:
+    """
+    空のセッション状態を作成する。
+    """
+    return {
+        "session_id": session_id,
+        "question": question,
+        "plans": [],
+        "findings": [],
+        "evaluations": [],
+        "thread_ids": [],
+        "retrievals": [],
+        "seen_chunk_ids": [],
+        "updated_at": time.time(),
+    }
+
+
+# %%
+class CheckpointStore:
+    """
+    セッション状態をJSONファイルとして保存するストア。
+    """
+
+    def __init__(self, directory: str | None = None):
+        """
+        Args:
+            directory: 保存先ディレクトリ（省略時は設定値）
+        """
+        self.directory = directory or config.CHECKPOINT_DIR
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def load(self, session_id: str) -> dict | None:
+        """
+        セッション状態を読み込む。存在しない・壊れている場合はNone。
+        """
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"警告: チェックポイントを読み込めませんでした ({path}): {e}")
+            return None
+
+    def save(self, state: dict) -> None:
+        """
+        セッション状態を保存する（一時ファイルに書き込んでから置き換える）。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        state["updated_at"] = time.time()
+        path = self._path(state["session_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def delete(self, session_id: str) -> None:
+        """
+        セッション状態を削除する。
+        """
+        path = self._path(session_id)
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,149 @@
+# %%
+"""
+クライアント生成モジュール
+
+Azure SDK のクライアント・資格情報・エージェント情報をプロセス内で再利用し、
+起動のたびに発生する初期化コストを抑える。
+
+- Azure SDK は実際にクライアントを生成するまでインポートしない
+- アクセストークンは有効期限までメモリ上で再利用する
+- エージェントのメタデータは有効期限付きでファイルにキャッシュする
+"""
+
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import config
+
+
+# %%
+class CachedTokenCredential:
+    """
+    アクセストークンを有効期限の少し前までキャッシュする資格情報ラッパー。
+
+    DefaultAzureCredential は取得のたびに資格情報チェーンを辿るため、
+    同じスコープのトークンはここで使い回す。トークンはディスクには保存しない。
+    """
+
+    def __init__(self, credential, refresh_margin_seconds: int = 300):
+        """
+        Args:
+            credential: ラップする資格情報（get_token を持つもの）
+            refresh_margin_seconds: 有効期限の何秒前に再取得するか
+        """
+        self._credential = credential
+        self._refresh_margin = refresh_margin_seconds
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes, claims=None, tenant_id=None, **kwargs):
+        key = (scopes, claims, tenant_id)
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is not None and token.expires_on - self._refresh_margin > time.time():
+                return token
+        token = self._credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+        with self._lock:
+            self._tokens[key] = token
+        return token
+
+    def close(self) -> None:
+        close = getattr(self._credential, "close", None)
+        if close is not None:
+            close()
+
+
+# %%
+class AgentCache:
+    """
+    エージェントのメタデータ（ID・名前・モデル）を有効期限付きで保持するキャッシュ。
+    """
+
+    def __init__(self, path: str | None = None, ttl_seconds: int | None = None, persist: bool = True):
+        """
+        Args:
+            path: キャッシュファイルのパス（省略時は設定値）
+            ttl_seconds: 有効期限（秒、省略時は設定値）
+            persist: ファイルに保存するか（False の場合はメモリ上のみ）
+        """
+        self.path = path or config.AGENT_CACHE_PATH
+        self.ttl_seconds = config.AGENT_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._entries = self._load() if persist else {}
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def get(self, agent_id: str):
+        """
+        有効期限内のエージェント情報を返す。なければNone。
+        """
+        with self._lock:
+            entry = self._entries.get(agent_id)
+        if entry is None or time.time() - entry["cached_at"] > self.ttl_seconds:
+            return None
+        return SimpleNamespace(id=entry["id"], name=entry.get("name"), model=entry.get("model"))
+
+    def put(self, agent) -> None:
+        """
+        エージェント情報を保存する。
+        """
+        with self._lock:
+            self._entries[agent.id] = {
+                "id": agent.id,
+                "name": getattr(agent, "name", None),
+                "model": getattr(agent, "model", None),
+                "cached_at": time.time(),
+            }
+            if self.persist:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+
+
+# %%
+_lock = threading.Lock()
+_credential = None
+_project_client = None
+
+
+def get_credential() -> CachedTokenCredential:
+    """
+    プロセス共通の資格情報を返す（初回のみ DefaultAzureCredential を生成）。
+    """
+    global _credential
+    with _lock:
+        if _credential is None:
+            from azure.identity import DefaultAzureCredential
+            _credential = CachedTokenCredential(DefaultAzureCredential())
+        return _credential
+
+
+def get_project_client():
+    """
+    プロセス共通の AIProjectClient を返す（初回のみ生成）。
+    """
+    global _project_client
+    credential = get_credential()
+    with _lock:
+        if _project_client is None:
+            from azure.ai.projects import AIProjectClient
+            _project_client = AIProjectClient(
+                endpoint=config.AZURE_AI_PROJECT_CONNECTION_STRING,
+                credential=credential,
+            )
+        return _project_client
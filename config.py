@@ -20,9 +20,17 @@ AZURE_AI_SEARCH_CONNECTION_ID = os.getenv("AZURE_AI_SEARCH_CONNECTION_ID", "")
 AZURE_AI_SEARCH_ENDPOINT = os.getenv("AZURE_AI_SEARCH_ENDPOINT", "")
 AZURE_AI_SEARCH_API_KEY = os.getenv("AZURE_AI_SEARCH_API_KEY", "")
 AZURE_AI_SEARCH_INDEX_NAME = os.getenv("AZURE_AI_SEARCH_INDEX_NAME", "")
+# セマンティック検索の構成名（semantic 系の検索方式で使用）
+AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION = os.getenv("AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION", "")
+# HNSW の検索時の候補数（Tools/azure_aisearch_create_index.py で使用、大きいほど再現率が上がり遅くなる）
+AZURE_AI_SEARCH_EF_SEARCH = int(os.getenv("AZURE_AI_SEARCH_EF_SEARCH", "500"))
 
 # Azure OpenAI 設定
 AZURE_OPENAI_MODEL_DEPLOYMENT = os.getenv("AZURE_OPENAI_MODEL_DEPLOYMENT", "gpt-4o")
+AZURE_OPENAI_API_ENDPOINT = os.getenv("AZURE_OPENAI_API_ENDPOINT", "")
+AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY", "")
+AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-large")
 
 # エージェントID
 PLANNER_AGENT_ID = os.getenv("PLANNER_AGENT_ID", "")
@@ -31,6 +39,57 @@ CRITIC_AGENT_ID = os.getenv("CRITIC_AGENT_ID", "")
 
 # Deep Research 設定
 MAX_RESEARCH_ITERATIONS = int(os.getenv("MAX_RESEARCH_ITERATIONS", "3"))
+# エージェント実行状態のポーリング間隔（秒）
+RUN_POLL_INTERVAL_SECONDS = float(os.getenv("RUN_POLL_INTERVAL_SECONDS", "1.0"))
+# セッション状態（チェックポイント）の保存先ディレクトリ
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", ".checkpoints")
+# エージェント情報のキャッシュファイルと有効期限（秒）
+AGENT_CACHE_PATH = os.getenv("AGENT_CACHE_PATH", ".cache/agents.json")
+AGENT_CACHE_TTL_SECONDS = int(os.getenv("AGENT_CACHE_TTL_SECONDS", "3600"))
+
+# 根拠の事前取得設定（Researcher の実行前にクライアント側で検索し、結果をメモする）
+# 検索方式と取得件数は Tools/create_agents.py の Researcher の検索ツールにも使用する
+# （benchmarks/bench_retrieval.py の評価結果を --write-env で書き込める）
+RETRIEVAL_PREFETCH = os.getenv("RETRIEVAL_PREFETCH", "false").lower() == "true"
+RETRIEVAL_QUERY_TYPE = os.getenv("RETRIEVAL_QUERY_TYPE", "simple")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+# 根拠のトークン数の上限（0 の場合は詰め込みを行わず、各クエリの上位 RETRIEVAL_TOP_K 件をそのまま渡す）
+RETRIEVAL_CONTEXT_TOKENS = int(os.getenv("RETRIEVAL_CONTEXT_TOKENS", "4000"))
+# 詰め込み時に1クエリあたり取得する候補数と、MMR の関連度の重み（1.0 で関連度のみ）
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+# 類似クエリとみなすクエリベクトルのコサイン類似度
+RETRIEVAL_SIMILARITY_THRESHOLD = float(os.getenv("RETRIEVAL_SIMILARITY_THRESHOLD", "0.92"))
+# セッションをまたいだ検索結果メモ（SQLite）の保存先と有効期限（秒、パスが空の場合はセッション内のみ）
+RETRIEVAL_MEMO_PATH = os.getenv("RETRIEVAL_MEMO_PATH", "")
+RETRIEVAL_MEMO_TTL_SECONDS = int(os.getenv("RETRIEVAL_MEMO_TTL_SECONDS", "86400"))
+# 類似クエリの判定で比較する、セッションをまたいだメモのエントリ数の上限（新しい順）
+RETRIEVAL_MEMO_SCAN_LIMIT = int(os.getenv("RETRIEVAL_MEMO_SCAN_LIMIT", "1000"))
+
+# HTTP サービス設定
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8000"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "4"))
+SERVICE_MAX_QUEUE = int(os.getenv("SERVICE_MAX_QUEUE", "32"))
+SERVICE_JOB_TTL_SECONDS = int(os.getenv("SERVICE_JOB_TTL_SECONDS", "3600"))
+
+# 分散ジョブキュー設定
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "sqlite:///.jobs/jobs.db")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# レート制限設定（1分あたりのリクエスト数 / トークン数、0 の場合は制限なし）
+AZURE_OPENAI_CHAT_RPM = int(os.getenv("AZURE_OPENAI_CHAT_RPM", "0"))
+AZURE_OPENAI_CHAT_TPM = int(os.getenv("AZURE_OPENAI_CHAT_TPM", "0"))
+AZURE_OPENAI_EMBEDDING_RPM = int(os.getenv("AZURE_OPENAI_EMBEDDING_RPM", "0"))
+AZURE_OPENAI_EMBEDDING_TPM = int(os.getenv("AZURE_OPENAI_EMBEDDING_TPM", "0"))
+AZURE_AI_SEARCH_RPM = int(os.getenv("AZURE_AI_SEARCH_RPM", "0"))
+AZURE_CONTENT_UNDERSTANDING_RPM = int(os.getenv("AZURE_CONTENT_UNDERSTANDING_RPM", "0"))
+
+# 再試行設定
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "6"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "1.0"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "60.0"))
 
 
 # %%
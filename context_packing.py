@@ -0,0 +1,171 @@
+# %%
+"""
+コンテキスト詰め込みモジュール
+
+検索で取得したチャンクから、Researcher に渡す根拠を決められたトークン数に収める。
+
+- インデックスに保存済みの content_vector を使い、MMR（Maximal Marginal Relevance）で
+  関連性が高く互いに重複の少ないチャンクから順に選ぶ
+- 同じファイル（file_id）で chunk_no が連続するチャンクは1つの文章に結合する
+"""
+
+import numpy as np
+
+import config
+from rate_limiter import estimate_tokens
+
+
+# %%
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def mmr_order(vectors: np.ndarray, relevance: np.ndarray, lambda_mult: float) -> list[int]:
+    """
+    MMR でチャンクの選択順を決める。
+
+    Args:
+        vectors: チャンクのベクトル（n × 次元数、ベクトルがないチャンクはゼロベクトル）
+        relevance: クエリとの関連度（n）
+        lambda_mult: 関連度の重み（1.0 で関連度のみ、0.0 で多様性のみ）
+
+    Returns:
+        list[int]: 選択順に並べたチャンクのインデックス
+    """
+    count = len(relevance)
+    if count == 0:
+        return []
+    unit = _normalize_rows(vectors)
+    similarity = unit @ unit.T
+    max_similarity = np.zeros(count)
+    remaining = np.ones(count, dtype=bool)
+    order = []
+    for _ in range(count):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~remaining] = -np.inf
+        index = int(np.argmax(scores))
+        order.append(index)
+        remaining[index] = False
+        np.maximum(max_similarity, similarity[index], out=max_similarity)
+    return order
+
+
+def _relevance(chunks: list[dict], vectors: np.ndarray, query_vectors: dict[str, list[float] | None]) -> np.ndarray:
+    """
+    各チャンクと取得元クエリの関連度を計算する。
+    クエリのベクトルがない場合は、クエリごとに正規化した検索スコアを使用する。
+    """
+    relevance = np.zeros(len(chunks))
+    unit = _normalize_rows(vectors)
+    max_scores: dict[str, float] = {}
+    for chunk in chunks:
+        score = chunk.get("score") or 0.0
+        max_scores[chunk["query"]] = max(max_scores.get(chunk["query"], 0.0), score)
+
+    for i, chunk in enumerate(chunks):
+        query_vector = query_vectors.get(chunk["query"])
+        if query_vector is not None and len(query_vector) == unit.shape[1] and unit[i].any():
+            query_unit = np.asarray(query_vector, dtype=np.float32)
+            relevance[i] = float(unit[i] @ (query_unit / (np.linalg.norm(query_unit) or 1.0)))
+        elif max_scores[chunk["query"]] > 0:
+            relevance[i] = (chunk.get("score") or 0.0) / max_scores[chunk["query"]]
+    return relevance
+
+
+def merge_adjacent(chunks: list[dict]) -> list[dict]:
+    """
+    同じファイルで chunk_no が連続するチャンクを1つの文章に結合する。
+
+    Args:
+        chunks: 選択済みのチャンク（選択順）
+
+    Returns:
+        list[dict]: 文章（ids, queries, file_name, file_id, chunk_no, content）。
+            文章の順序は含まれるチャンクのうち最も早く選ばれたものの順
+    """
+    by_file: dict[str, list[tuple[int, dict]]] = {}
+    for rank, chunk in enumerate(chunks):
+        by_file.setdefault(chunk.get("file_id") or chunk["id"], []).append((rank, chunk))
+
+    passages = []
+    for members in by_file.values():
+        members.sort(key=lambda item: item[1].get("chunk_no") or 0)
+        current = None
+        for rank, chunk in members:
+            chunk_no = chunk.get("chunk_no")
+            if current is not None and chunk_no is not None and chunk_no == current["last_chunk_no"] + 1:
+                current["ids"].append(chunk["id"])
+                current["content"] += "\n\n" + chunk["content"]
+                current["last_chunk_no"] = chunk_no
+                current["rank"] = min(current["rank"], rank)
+                if chunk["query"] not in current["queries"]:
+                    current["queries"].append(chunk["query"])
+                continue
+            current = {
+                "rank": rank,
+                "ids": [chunk["id"]],
+                "queries": [chunk["query"]],
+                "file_name": chunk.get("file_name"),
+                "file_id": chunk.get("file_id"),
+                "first_chunk_no": chunk_no,
+                "last_chunk_no": chunk_no if chunk_no is not None else -2,
+                "content": chunk["content"],
+            }
+            passages.append(current)
+
+    passages.sort(key=lambda p: p["rank"])
+    return [
+        {
+            "ids": p["ids"],
+            "queries": p["queries"],
+            "file_name": p["file_name"],
+            "file_id": p["file_id"],
+            "chunk_no": (
+                p["first_chunk_no"] if len(p["ids"]) == 1 else f"{p['first_chunk_no']}-{p['last_chunk_no']}"
+            ),
+            "content": p["content"],
+        }
+        for p in passages
+    ]
+
+
+# %%
+def pack_context(chunks: list[dict], query_vectors: dict[str, list[float] | None] | None = None,
+                 token_budget: int | None = None, lambda_mult: float | None = None) -> list[dict]:
+    """
+    チャンクを MMR の順にトークン数の上限まで選び、隣接するチャンクを結合する。
+
+    Args:
+        chunks: 候補のチャンク（query, id, content, file_id, chunk_no, score, content_vector）。
+            content_vector がないチャンクは他のチャンクと重複しないものとして扱う
+        query_vectors: クエリごとのベクトル（省略時は検索スコアを関連度に使用）
+        token_budget: 根拠全体のトークン数の上限（省略時は設定値）
+        lambda_mult: MMR の関連度の重み（省略時は設定値）
+
+    Returns:
+        list[dict]: Researcher に渡す文章（merge_adjacent の形式）
+    """
+    if not chunks:
+        return []
+    token_budget = token_budget or config.RETRIEVAL_CONTEXT_TOKENS
+    lambda_mult = config.RETRIEVAL_MMR_LAMBDA if lambda_mult is None else lambda_mult
+
+    dimensions = max((len(c.get("content_vector") or []) for c in chunks), default=0)
+    vectors = np.zeros((len(chunks), max(dimensions, 1)), dtype=np.float32)
+    for i, chunk in enumerate(chunks):
+        vector = chunk.get("content_vector")
+        if vector and len(vector) == dimensions:
+            vectors[i] = vector
+
+    relevance = _relevance(chunks, vectors, query_vectors or {})
+    selected = []
+    used = 0
+    for index in mmr_order(vectors, relevance, lambda_mult):
+        tokens = estimate_tokens(chunks[index]["content"] or "")
+        if used + tokens > token_budget:
+            # 大きいチャンクで上限を超える場合も、後続の小さいチャンクは詰める
+            continue
+        selected.append(chunks[index])
+        used += tokens
+    return merge_adjacent(selected)
@@ -0,0 +1,577 @@
+# %%
+"""
+ジョブキューモジュール
+
+調査（research）とデータ取り込み（ingest）のジョブを複数のワーカープロセス・ノードに
+分散するためのキューを提供する。
+
+- ワーカーはリース（有効期限付きの占有）を取得してジョブを処理する
+- 処理中はハートビートでリースを延長する
+- リースが切れたジョブは他のワーカーが再取得する（最大試行回数まで）
+
+実装:
+- SQLiteJobQueue: 単一ノード向け（SQLite の WAL モードはネットワークファイルシステムでは動作しない）
+- RedisJobQueue: 複数ノード向け。redis-py 互換のクライアントを渡す
+  （ローカル確認用に LocalRedis を同梱）
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+import config
+
+
+# %%
+@dataclass
+class LeasedJob:
+    """
+    ワーカーがリースを取得したジョブ。
+    """
+    id: str
+    kind: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+    lease_owner: str
+
+
+class JobQueue:
+    """
+    ジョブキューの共通インターフェース。
+    """
+
+    def enqueue(self, kind: str, payload: dict, max_attempts: int | None = None) -> str:
+        """
+        ジョブを投入してIDを返す。
+        """
+        raise NotImplementedError
+
+    def lease(self, kinds: list[str], worker_id: str, lease_seconds: float) -> LeasedJob | None:
+        """
+        処理可能なジョブを1件リースする。なければNone。
+        リース切れのジョブも再取得の対象になる。
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, job: LeasedJob, lease_seconds: float) -> bool:
+        """
+        リースを延長する。リースを失っていた場合はFalse。
+        """
+        raise NotImplementedError
+
+    def complete(self, job: LeasedJob, result=None) -> None:
+        """
+        ジョブを完了にする。
+        """
+        raise NotImplementedError
+
+    def fail(self, job: LeasedJob, error: str) -> bool:
+        """
+        ジョブの失敗を記録する。試行回数が残っていれば再投入する。
+        リースを失っていた（他のワーカーが処理している）場合は記録せずFalse。
+        """
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> dict | None:
+        """
+        ジョブの状態を返す。
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict[str, int]:
+        """
+        状態ごとのジョブ数を返す。
+        """
+        raise NotImplementedError
+
+
+# %%
+class SQLiteJobQueue(JobQueue):
+    """
+    SQLiteをバックエンドとするジョブキュー（WALモードで同一ノードの複数プロセスから利用可能）。
+    データベースファイルはローカルディスクに置く（NFS / SMB 等の共有ファイルシステムは不可）。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: データベースファイルのパス
+        """
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, kind, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 の接続はスレッド間で共有できないため、スレッドごとに保持する
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: dict, max_attempts: int | None = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, payload, status, max_attempts, created_at, updated_at)"
+            " VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json.dumps(payload, ensure_ascii=False),
+             max_attempts or config.JOB_MAX_ATTEMPTS, now, now),
+        )
+        return job_id
+
+    def lease(self, kinds: list[str], worker_id: str, lease_seconds: float) -> LeasedJob | None:
+        conn = self._connect()
+        now = time.time()
+        placeholders = ",".join("?" for _ in kinds)
+        # 他のワーカーと同じジョブを取得しないよう、書き込みロックを取ってから選択する
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # リース切れで試行回数を使い切ったジョブは打ち切る
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', error = 'lease expired', updated_at = ?"
+                " WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE kind IN ({placeholders})"
+                " AND (status = 'queued' OR (status = 'leased' AND lease_expires < ?))"
+                " ORDER BY created_at LIMIT 1",
+                (*kinds, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_owner = ?,"
+                " lease_expires = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return LeasedJob(
+            id=row["id"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            attempts=row["attempts"] + 1,
+            max_attempts=row["max_attempts"],
+            lease_owner=worker_id,
+        )
+
+    def heartbeat(self, job: LeasedJob, lease_seconds: float) -> bool:
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ?"
+            " WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now + lease_seconds, now, job.id, job.lease_owner),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job: LeasedJob, result=None) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET status = 'completed', result = ?, lease_owner = NULL,"
+            " lease_expires = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), job.id, job.lease_owner),
+        )
+
+    def fail(self, job: LeasedJob, error: str) -> bool:
+        status = "queued" if job.attempts < job.max_attempts else "dead"
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL,"
+            " updated_at = ? WHERE id = ? AND lease_owner = ?",
+            (status, error, time.time(), job.id, job.lease_owner),
+        )
+        return cursor.rowcount == 1
+
+    def get(self, job_id: str) -> dict | None:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def stats(self) -> dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+# %%
+# RedisJobQueue の状態遷移は Lua スクリプトで1コマンドとして実行し、
+# 途中でワーカーが停止してもジョブがキューとリースのどちらからも消えないようにする。
+# ジョブのキーはスクリプト内で接頭辞から組み立てるため、Redis Cluster には対応しない。
+
+# KEYS: 待機キュー, リース  ARGV: ジョブキーの接頭辞, ワーカーID, 現在時刻, リースの有効期限
+LEASE_SCRIPT = """
+local job_id = redis.call('RPOP', KEYS[1])
+if not job_id then return false end
+local key = ARGV[1] .. job_id
+local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'status', 'leased', 'lease_owner', ARGV[2], 'updated_at', ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[4], job_id)
+return {job_id, attempts, redis.call('HGET', key, 'payload'), redis.call('HGET', key, 'max_attempts')}
+"""
+
+# KEYS: リース  ARGV: キーの接頭辞（namespace:）, 現在時刻
+REQUEUE_EXPIRED_SCRIPT = """
+local requeued = 0
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])) do
+    redis.call('ZREM', KEYS[1], job_id)
+    local key = ARGV[1] .. 'job:' .. job_id
+    local job = redis.call('HMGET', key, 'kind', 'attempts', 'max_attempts')
+    if job[1] then
+        if tonumber(job[2]) >= tonumber(job[3]) then
+            redis.call('HSET', key, 'status', 'dead', 'error', 'lease expired', 'lease_owner', '', 'updated_at', ARGV[2])
+        else
+            redis.call('HSET', key, 'status', 'queued', 'lease_owner', '', 'updated_at', ARGV[2])
+            redis.call('RPUSH', ARGV[1] .. 'queue:' .. job[1], job_id)
+            requeued = requeued + 1
+        end
+    end
+end
+return requeued
+"""
+
+# KEYS: ジョブ, リース  ARGV: ワーカーID, ジョブID, リースの有効期限
+HEARTBEAT_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'lease_owner') ~= ARGV[1] then return 0 end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+return 1
+"""
+
+# KEYS: ジョブ, リース  ARGV: ワーカーID, ジョブID, 結果（JSON）, 現在時刻
+COMPLETE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'lease_owner') ~= ARGV[1] then return 0 end
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('HSET', KEYS[1], 'status', 'completed', 'result', ARGV[3], 'lease_owner', '', 'updated_at', ARGV[4])
+return 1
+"""
+
+# KEYS: ジョブ, リース, 待機キュー  ARGV: ワーカーID, ジョブID, エラー, 現在時刻, 再投入するか（1 / 0）
+FAIL_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'lease_owner') ~= ARGV[1] then return 0 end
+redis.call('ZREM', KEYS[2], ARGV[2])
+local status = 'dead'
+if ARGV[5] == '1' then status = 'queued' end
+redis.call('HSET', KEYS[1], 'status', status, 'error', ARGV[3], 'lease_owner', '', 'updated_at', ARGV[4])
+if ARGV[5] == '1' then redis.call('RPUSH', KEYS[3], ARGV[2]) end
+return 1
+"""
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Redisをバックエンドとするジョブキュー。
+
+    キー構成（namespace が "drq" の場合）:
+    - drq:job:{id}      ジョブ情報（ハッシュ）
+    - drq:queue:{kind}  待機中のジョブID（リスト）
+    - drq:leases        リース中のジョブID（ソート済みセット、スコアは有効期限）
+
+    リースの取得・延長・完了・失敗とリース切れの再投入は、それぞれ Lua スクリプトで原子的に行う。
+    """
+
+    def __init__(self, client, namespace: str = "drq"):
+        """
+        Args:
+            client: redis.Redis 互換のクライアント（decode_responses=True、register_script が必要）
+            namespace: キーの接頭辞
+        """
+        self.client = client
+        self.namespace = namespace
+        self._lease = client.register_script(LEASE_SCRIPT)
+        self._requeue = client.register_script(REQUEUE_EXPIRED_SCRIPT)
+        self._heartbeat = client.register_script(HEARTBEAT_SCRIPT)
+        self._complete = client.register_script(COMPLETE_SCRIPT)
+        self._fail = client.register_script(FAIL_SCRIPT)
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.namespace, *parts))
+
+    def enqueue(self, kind: str, payload: dict, max_attempts: int | None = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.client.hset(self._key("job", job_id), mapping={
+            "id": job_id,
+            "kind": kind,
+            "payload": json.dumps(payload, ensure_ascii=False),
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts or config.JOB_MAX_ATTEMPTS,
+            "created_at": now,
+            "updated_at": now,
+        })
+        self.client.lpush(self._key("queue", kind), job_id)
+        return job_id
+
+    def _requeue_expired(self, now: float) -> None:
+        """
+        リース切れのジョブを待機キューに戻す（試行回数を使い切った場合は打ち切る）。
+        """
+        self._requeue(keys=[self._key("leases")], args=[self._key(""), now])
+
+    def lease(self, kinds: list[str], worker_id: str, lease_seconds: float) -> LeasedJob | None:
+        now = time.time()
+        self._requeue_expired(now)
+        for kind in kinds:
+            claimed = self._lease(
+                keys=[self._key("queue", kind), self._key("leases")],
+                args=[self._key("job", ""), worker_id, now, now + lease_seconds],
+            )
+            if not claimed:
+                continue
+            job_id, attempts, payload, max_attempts = claimed
+            return LeasedJob(
+                id=job_id,
+                kind=kind,
+                payload=json.loads(payload),
+                attempts=int(attempts),
+                max_attempts=int(max_attempts),
+                lease_owner=worker_id,
+            )
+        return None
+
+    def heartbeat(self, job: LeasedJob, lease_seconds: float) -> bool:
+        return bool(self._heartbeat(
+            keys=[self._key("job", job.id), self._key("leases")],
+            args=[job.lease_owner, job.id, time.time() + lease_seconds],
+        ))
+
+    def complete(self, job: LeasedJob, result=None) -> None:
+        self._complete(
+            keys=[self._key("job", job.id), self._key("leases")],
+            args=[job.lease_owner, job.id, json.dumps(result, ensure_ascii=False), time.time()],
+        )
+
+    def fail(self, job: LeasedJob, error: str) -> bool:
+        retry = job.attempts < job.max_attempts
+        return bool(self._fail(
+            keys=[self._key("job", job.id), self._key("leases"), self._key("queue", job.kind)],
+            args=[job.lease_owner, job.id, error, time.time(), 1 if retry else 0],
+        ))
+
+    def get(self, job_id: str) -> dict | None:
+        job = self.client.hgetall(self._key("job", job_id))
+        if not job:
+            return None
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        return job
+
+    def stats(self) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for key in self.client.scan_iter(match=self._key("job", "*")):
+            status = self.client.hget(key, "status")
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+
+# %%
+class LocalRedis:
+    """
+    RedisJobQueue が使用するコマンドだけを実装したプロセス内のRedis代替。
+    Redisサーバーなしでの動作確認やテストに使用する。
+
+    Lua スクリプトは実行できないため、register_script では同じ処理を
+    Python で実装したものをロックを保持したまま実行する。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._hashes: dict[str, dict[str, str]] = {}
+        self._lists: dict[str, list[str]] = {}
+        self._zsets: dict[str, dict[str, float]] = {}
+        self._scripts = {
+            LEASE_SCRIPT: self._lease_script,
+            REQUEUE_EXPIRED_SCRIPT: self._requeue_expired_script,
+            HEARTBEAT_SCRIPT: self._heartbeat_script,
+            COMPLETE_SCRIPT: self._complete_script,
+            FAIL_SCRIPT: self._fail_script,
+        }
+
+    def register_script(self, script: str):
+        function = self._scripts[script]
+
+        def run(keys=(), args=()):
+            with self._lock:
+                return function(list(keys), [str(a) for a in args])
+        return run
+
+    def _lease_script(self, keys, args):
+        job_id = self.rpop(keys[0])
+        if job_id is None:
+            return None
+        key = args[0] + job_id
+        attempts = self.hincrby(key, "attempts", 1)
+        self.hset(key, mapping={"status": "leased", "lease_owner": args[1], "updated_at": args[2]})
+        self.zadd(keys[1], {job_id: args[3]})
+        return [job_id, attempts, self.hget(key, "payload"), self.hget(key, "max_attempts")]
+
+    def _requeue_expired_script(self, keys, args):
+        requeued = 0
+        for job_id in self.zrangebyscore(keys[0], "-inf", args[1]):
+            self.zrem(keys[0], job_id)
+            key = f"{args[0]}job:{job_id}"
+            job = self.hgetall(key)
+            if not job:
+                continue
+            if int(job["attempts"]) >= int(job["max_attempts"]):
+                self.hset(key, mapping={
+                    "status": "dead", "error": "lease expired", "lease_owner": "", "updated_at": args[1],
+                })
+            else:
+                self.hset(key, mapping={"status": "queued", "lease_owner": "", "updated_at": args[1]})
+                self.rpush(f"{args[0]}queue:{job['kind']}", job_id)
+                requeued += 1
+        return requeued
+
+    def _heartbeat_script(self, keys, args):
+        if self.hget(keys[0], "lease_owner") != args[0]:
+            return 0
+        self.zadd(keys[1], {args[1]: args[2]})
+        return 1
+
+    def _complete_script(self, keys, args):
+        if self.hget(keys[0], "lease_owner") != args[0]:
+            return 0
+        self.zrem(keys[1], args[1])
+        self.hset(keys[0], mapping={"status": "completed", "result": args[2], "lease_owner": "", "updated_at": args[3]})
+        return 1
+
+    def _fail_script(self, keys, args):
+        if self.hget(keys[0], "lease_owner") != args[0]:
+            return 0
+        self.zrem(keys[1], args[1])
+        retry = args[4] == "1"
+        self.hset(keys[0], mapping={
+            "status": "queued" if retry else "dead", "error": args[2], "lease_owner": "", "updated_at": args[3],
+        })
+        if retry:
+            self.rpush(keys[2], args[1])
+        return 1
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            values = self._hashes.setdefault(key, {})
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            added = sum(1 for k in items if k not in values)
+            values.update({k: str(v) for k, v in items.items()})
+            return added
+
+    def hget(self, key, field):
+        with self._lock:
+            return self._hashes.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._hashes.get(key, {}))
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            values = self._hashes.setdefault(key, {})
+            values[field] = str(int(values.get(field, 0)) + amount)
+            return int(values[field])
+
+    def lpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            for value in values:
+                items.insert(0, value)
+            return len(items)
+
+    def rpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            items.extend(values)
+            return len(items)
+
+    def rpop(self, key):
+        with self._lock:
+            items = self._lists.get(key)
+            return items.pop() if items else None
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            members = self._zsets.setdefault(key, {})
+            added = sum(1 for m in mapping if m not in members)
+            members.update({m: float(s) for m, s in mapping.items()})
+            return added
+
+    def zrem(self, key, *members):
+        with self._lock:
+            zset = self._zsets.get(key, {})
+            return sum(1 for m in members if zset.pop(m, None) is not None)
+
+    def zrangebyscore(self, key, minimum, maximum):
+        low, high = float(minimum), float(maximum)
+        with self._lock:
+            items = sorted(self._zsets.get(key, {}).items(), key=lambda item: item[1])
+            return [m for m, score in items if low <= score <= high]
+
+    def scan_iter(self, match=None):
+        prefix = (match or "*").rstrip("*")
+        with self._lock:
+            keys = [k for k in self._hashes if k.startswith(prefix)]
+        yield from keys
+
+
+# %%
+def open_queue(url: str | None = None) -> JobQueue:
+    """
+    URLからジョブキューを生成する。
+
+    - sqlite:///path/to/jobs.db  SQLite（単一ノードのみ）
+    - redis://host:6379/0        Redis（redis パッケージが必要）
+    - local://                   プロセス内のRedis代替（動作確認用）
+
+    Args:
+        url: キューのURL（省略時は設定値）
+    """
+    url = url or config.JOB_QUEUE_URL
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        return SQLiteJobQueue(url[len("sqlite:///"):])
+    if parsed.scheme in ("redis", "rediss"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Redisキューを使用するには redis パッケージをインストールしてください。")
+        return RedisJobQueue(redis.Redis.from_url(url, decode_responses=True))
+    if parsed.scheme == "local":
+        return RedisJobQueue(LocalRedis())
+    raise ValueError(f"未対応のキューURLです: {url}")
@@ -0,0 +1,344 @@
+# %%
+"""
+レート制限・リトライ管理モジュール
+
+Azure の各サービス（chat / embeddings / search / content_understanding）への
+呼び出しをプロセス全体で共有するトークンバケットで制御する。
+
+- RPM（リクエスト数/分）と TPM（トークン数/分）のクォータを守るよう待機する
+- 優先度クラス（対話的な調査 > 一括取り込み）の順に割り当てる
+- 429 等のスロットリング時は Retry-After を尊重し、ジッター付きで再試行する
+"""
+
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+
+import config
+
+
+# %%
+class Priority(IntEnum):
+    """
+    呼び出しの優先度（値が小さいほど優先）。
+    """
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class ThrottledError(Exception):
+    """
+    サービスがスロットリング（または一時的な失敗）を返したことを表す例外。
+    """
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# 再試行の対象とするHTTPステータス
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class ServiceLimits:
+    """
+    サービスごとのクォータ（0 の場合は制限なし）。
+    """
+    rpm: int = 0
+    tpm: int = 0
+
+
+# %%
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算する（ASCIIは4文字で1トークン、それ以外は1文字1トークン）。
+    """
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return max(1, ascii_chars // 4 + (len(text) - ascii_chars))
+
+
+def _parse_retry_after(value: str) -> float | None:
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_from_headers(headers) -> float | None:
+    """
+    レスポンスヘッダーから待機秒数を取得する（retry-after-ms / Retry-After）。
+    """
+    if not headers:
+        return None
+    lowered = {str(k).lower(): v for k, v in headers.items()}
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        if lowered.get(name):
+            parsed = _parse_retry_after(lowered[name])
+            if parsed is not None:
+                return parsed / 1000.0
+    if lowered.get("retry-after"):
+        return _parse_retry_after(lowered["retry-after"])
+    return None
+
+
+def retry_after_from_message(message: str | None) -> float | None:
+    """
+    "Try again in 20 seconds" のようなエラーメッセージから待機秒数を取得する。
+    """
+    match = re.search(r"(\d+(?:\.\d+)?)\s*seconds?", message or "")
+    return float(match.group(1)) if match else None
+
+
+# SDK の接続エラー・タイムアウト（openai の APIConnectionError / APITimeoutError、
+# azure-core の ServiceRequestError / ServiceResponseError）。SDK 側の再試行を無効化しているため
+# ここで再試行する。SDK を import せずに判定するため、クラス名で照合する
+CONNECTION_ERROR_NAMES = {"APIConnectionError", "ServiceRequestError", "ServiceResponseError"}
+
+
+def classify_error(error: Exception) -> tuple[bool, float | None]:
+    """
+    例外が再試行可能かを判定し、サーバー指定の待機秒数を返す。
+
+    Returns:
+        tuple[bool, float | None]: (再試行可能か, Retry-After の秒数)
+    """
+    if isinstance(error, ThrottledError):
+        return True, error.retry_after
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True, None
+    if any(cls.__name__ in CONNECTION_ERROR_NAMES for cls in type(error).__mro__):
+        return True, None
+
+    # azure-core の HttpResponseError / openai の APIStatusError 等
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status in RETRYABLE_STATUS_CODES:
+        return True, retry_after_from_headers(getattr(response, "headers", None))
+    return False, None
+
+
+# %%
+class _Bucket:
+    """
+    連続的に補充されるトークンバケット。
+    """
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        # 10秒分までのバーストを許容する
+        self.capacity = max(1.0, per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class ServiceLimiter:
+    """
+    1つのサービスに対する RPM / TPM のバケットと優先度付き待ち行列。
+    """
+
+    def __init__(self, limits: ServiceLimits):
+        self._requests = _Bucket(limits.rpm) if limits.rpm > 0 else None
+        self._tokens = _Bucket(limits.tpm) if limits.tpm > 0 else None
+        self._cond = threading.Condition()
+        self._waiters: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._blocked_until = 0.0
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        wait = self._blocked_until - now
+        if self._requests is not None:
+            self._requests.refill(now)
+            wait = max(wait, self._requests.wait_time(1))
+        if self._tokens is not None and tokens > 0:
+            self._tokens.refill(now)
+            wait = max(wait, self._tokens.wait_time(tokens))
+        return wait
+
+    def acquire(self, tokens: int = 0, priority: Priority = Priority.INTERACTIVE) -> float:
+        """
+        クォータが空くまで待機して割り当てを受ける。
+        優先度が高い（値が小さい）待機者から順に割り当てる。
+
+        Args:
+            tokens: 消費するトークン数の見積もり
+            priority: 呼び出しの優先度
+
+        Returns:
+            float: 待機した秒数
+        """
+        start = time.monotonic()
+        with self._cond:
+            ticket = (int(priority), next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiters[0] == ticket:
+                        now = time.monotonic()
+                        timeout = self._wait_time(now, tokens)
+                        if timeout <= 0:
+                            if self._requests is not None:
+                                self._requests.take(1)
+                            if self._tokens is not None and tokens > 0:
+                                self._tokens.take(tokens)
+                            return time.monotonic() - start
+                    self._cond.wait(timeout)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def block_for(self, seconds: float) -> None:
+        """
+        Retry-After に従い、指定秒数はこのサービスへの割り当てを停止する。
+        """
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+# %%
+class RetryScheduler:
+    """
+    サービスごとのレート制限とジッター付き再試行をまとめて行うスケジューラ。
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, ServiceLimits] | None = None,
+        max_attempts: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        seed: int | None = None,
+    ):
+        """
+        Args:
+            limits: サービス名ごとのクォータ（未指定のサービスは制限なし）
+            max_attempts: 最大試行回数
+            base_delay: 再試行の基準待機時間（秒）
+            max_delay: 再試行の最大待機時間（秒）
+            seed: ジッター用の乱数シード
+        """
+        self._limits = dict(limits or {})
+        self._limiters: dict[str, ServiceLimiter] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._stats: dict[str, dict[str, float]] = {}
+
+    def limiter(self, service: str) -> ServiceLimiter:
+        """
+        サービスのリミッターを取得する（未作成の場合は作成する）。
+        """
+        with self._lock:
+            if service not in self._limiters:
+                self._limiters[service] = ServiceLimiter(self._limits.get(service, ServiceLimits()))
+                self._stats[service] = {"calls": 0, "retries": 0, "throttled": 0, "waited": 0.0}
+            return self._limiters[service]
+
+    def _record(self, service: str, key: str, value: float = 1) -> None:
+        with self._lock:
+            self._stats[service][key] += value
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """
+        サービスごとの呼び出し数・再試行数・スロットリング数・待機秒数を返す。
+        """
+        with self._lock:
+            return {service: dict(values) for service, values in self._stats.items()}
+
+    def _backoff(self, attempt: int, retry_after: float | None) -> float:
+        if retry_after is not None:
+            # サーバー指定の待機時間に小さなジッターを加え、同時再開を避ける
+            return retry_after * (1 + self._rng.uniform(0, 0.1))
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return self._rng.uniform(delay / 2, delay)
+
+    def call(self, service: str, fn, *args, tokens: int = 0,
+             priority: Priority = Priority.INTERACTIVE, **kwargs):
+        """
+        クォータに従って fn を呼び出し、再試行可能なエラーは待機して再試行する。
+
+        Args:
+            service: サービス名（chat / embeddings / search / content_understanding、
+                クォータを設定していない agents 等は再試行のみ）
+            fn: 呼び出す関数
+            tokens: 消費するトークン数の見積もり
+            priority: 呼び出しの優先度
+
+        Returns:
+            fn の戻り値
+        """
+        limiter = self.limiter(service)
+        for attempt in range(self.max_attempts):
+            waited = limiter.acquire(tokens, priority)
+            self._record(service, "calls")
+            self._record(service, "waited", waited)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                retryable, retry_after = classify_error(e)
+                if not retryable or attempt == self.max_attempts - 1:
+                    raise
+                self._record(service, "retries")
+                delay = self._backoff(attempt, retry_after)
+                if retry_after is not None:
+                    # Retry-After はサービス全体への指示として扱う
+                    self._record(service, "throttled")
+                    limiter.block_for(delay)
+                else:
+                    time.sleep(delay)
+
+
+# %%
+_scheduler: RetryScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RetryScheduler:
+    """
+    設定値から作成したプロセス共通のスケジューラを返す。
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RetryScheduler(
+                limits={
+                    "chat": ServiceLimits(rpm=config.AZURE_OPENAI_CHAT_RPM, tpm=config.AZURE_OPENAI_CHAT_TPM),
+                    "embeddings": ServiceLimits(
+                        rpm=config.AZURE_OPENAI_EMBEDDING_RPM, tpm=config.AZURE_OPENAI_EMBEDDING_TPM
+                    ),
+                    "search": ServiceLimits(rpm=config.AZURE_AI_SEARCH_RPM),
+                    "content_understanding": ServiceLimits(rpm=config.AZURE_CONTENT_UNDERSTANDING_RPM),
+                },
+                max_attempts=config.RETRY_MAX_ATTEMPTS,
+                base_delay=config.RETRY_BASE_DELAY_SECONDS,
+                max_delay=config.RETRY_MAX_DELAY_SECONDS,
+            )
+        return _scheduler
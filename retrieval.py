@@ -0,0 +1,460 @@
+# %%
+"""
+検索（リトリーバル）モジュール
+
+Researcher に渡す根拠をクライアント側で Azure AI Search から取得する。
+検索方式は Researcher の AzureAISearchTool と同じ名前で指定する:
+simple / semantic / vector / vector_simple_hybrid / vector_semantic_hybrid
+
+検索結果は正規化したクエリと検索方式をキーにメモし、同じクエリや
+ベクトルの類似度が閾値以上のクエリは再検索しない。
+"""
+
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+
+import config
+from rate_limiter import Priority, estimate_tokens, get_scheduler
+
+
+# %%
+QUERY_TYPES = ["simple", "semantic", "vector", "vector_simple_hybrid", "vector_semantic_hybrid"]
+
+# 検索結果として取得するフィールド
+SELECT_FIELDS = ["id", "content", "file_name", "file_id", "chunk_no"]
+
+
+def uses_vector(query_type: str) -> bool:
+    """
+    検索方式がクエリのベクトルを必要とするか。
+    """
+    return query_type.startswith("vector")
+
+
+# %%
+class SearchRetriever:
+    """
+    Azure AI Search のインデックスからチャンクを取得するクラス。
+    """
+
+    def __init__(self, search_client, embedding_client=None, query_type: str | None = None,
+                 top_k: int | None = None, scheduler=None):
+        """
+        Args:
+            search_client: azure.search.documents.SearchClient
+            embedding_client: クエリのベクトル化に使用する AzureOpenAI クライアント
+                （vector 系の検索方式と、類似クエリの判定に必要）
+            query_type: 検索方式（省略時は設定値）
+            top_k: 取得件数（省略時は設定値）
+            scheduler: レート制限・再試行に使用するスケジューラ
+        """
+        self.search_client = search_client
+        self.embedding_client = embedding_client
+        self.query_type = query_type or config.RETRIEVAL_QUERY_TYPE
+        self.top_k = top_k or config.RETRIEVAL_TOP_K
+        self.scheduler = scheduler or get_scheduler()
+        self.search_calls = 0
+
+        if self.query_type not in QUERY_TYPES:
+            raise ValueError(f"未対応の検索方式です: {self.query_type}")
+
+    def embed(self, text: str) -> list[float] | None:
+        """
+        クエリをベクトル化する。ベクトル化クライアントがなければNone。
+        """
+        if self.embedding_client is None:
+            return None
+        response = self.scheduler.call(
+            "embeddings",
+            self.embedding_client.embeddings.create,
+            input=text[:8000],
+            model=config.AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+            tokens=estimate_tokens(text),
+            priority=Priority.INTERACTIVE,
+        )
+        return response.data[0].embedding
+
+    def search(self, query: str, query_type: str | None = None, top_k: int | None = None,
+               vector: list[float] | None = None, select: list[str] | None = None) -> list[dict]:
+        """
+        クエリに一致するチャンクを取得する。
+
+        Args:
+            query: 検索クエリ
+            query_type: 検索方式（省略時はこのRetrieverの既定値）
+            top_k: 取得件数（省略時はこのRetrieverの既定値）
+            vector: 事前に計算したクエリのベクトル（vector 系の検索方式で使用）
+            select: 取得するフィールド（省略時は SELECT_FIELDS）
+
+        Returns:
+            list[dict]: チャンク（id, content, file_name, file_id, chunk_no, score）
+        """
+        from azure.search.documents.models import VectorizedQuery
+
+        query_type = query_type or self.query_type
+        top_k = top_k or self.top_k
+        kwargs = {"select": select or SELECT_FIELDS, "top": top_k}
+
+        if uses_vector(query_type):
+            vector = vector or self.embed(query)
+            if vector is None:
+                raise ValueError("vector 系の検索方式にはベクトル化クライアントが必要です。")
+            kwargs["vector_queries"] = [
+                VectorizedQuery(vector=vector, k_nearest_neighbors=top_k, fields="content_vector")
+            ]
+        if query_type in ("simple", "semantic", "vector_simple_hybrid", "vector_semantic_hybrid"):
+            kwargs["search_text"] = query
+        if "semantic" in query_type:
+            if not config.AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION:
+                raise ValueError("semantic 系の検索方式には AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION が必要です。")
+            kwargs["query_type"] = "semantic"
+            kwargs["semantic_configuration_name"] = config.AZURE_AI_SEARCH_SEMANTIC_CONFIGURATION
+
+        def run_search():
+            return [
+                {**{field: result.get(field) for field in kwargs["select"]}, "score": result.get("@search.score")}
+                for result in self.search_client.search(**kwargs)
+            ]
+
+        self.search_calls += 1
+        return self.scheduler.call("search", run_search, priority=Priority.INTERACTIVE)
+
+
+# %%
+def normalize_query(query: str) -> str:
+    """
+    クエリを比較用に正規化する（NFKC・小文字化・記号の除去・空白の統一）。
+    日本語は語の区切りに空白を使わないため、ASCII以外の文字に隣接する空白は除去する。
+    """
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = "".join(" " if unicodedata.category(c)[0] in "PSZ" else c for c in text)
+    return re.sub(r"(?<=[^\x00-\x7f]) | (?=[^\x00-\x7f])", "", " ".join(text.split()))
+
+
+def fetch_shape(top_k: int, select: list[str]) -> str:
+    """
+    取得件数と取得フィールドを表す文字列（取得の仕方が異なる検索結果を区別するため、メモのキーに含める）。
+    """
+    return f"{top_k}/{'+'.join(select)}"
+
+
+def memo_key(query: str, query_type: str, shape: str = "") -> str:
+    if shape:
+        return f"{query_type}:{shape}:{normalize_query(query)}"
+    return f"{query_type}:{normalize_query(query)}"
+
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _most_similar(entries, query_type: str, shape: str, vector: list[float], vector_of, threshold: float):
+    """
+    同じ検索方式・取得の仕方のエントリのうち、類似度が閾値以上で最も近いものを返す。
+    """
+    best, best_score = None, threshold
+    for entry in entries:
+        if entry["query_type"] != query_type or entry.get("shape", "") != shape:
+            continue
+        other = vector_of(entry)
+        if other is None:
+            continue
+        score = cosine_similarity(vector, other)
+        if score >= best_score:
+            best, best_score = entry, score
+    return best
+
+
+# %%
+class SharedRetrievalMemo:
+    """
+    セッションをまたいで検索結果を再利用するメモ（有効期限付きで SQLite に保存）。
+
+    エントリはクエリごとに1行で追加・更新するため、保存のコストはエントリ数に依存しない。
+    類似クエリの判定は新しい順に最大 scan_limit 件のエントリを対象とする。
+    同じノードの複数プロセス（HTTP サービスと分散ワーカー）から WAL モードで共有できる
+    （ネットワークファイルシステム上のファイルは不可）。
+    """
+
+    def __init__(self, path: str | None = None, ttl_seconds: int | None = None,
+                 similarity_threshold: float | None = None, scan_limit: int | None = None):
+        """
+        Args:
+            path: 保存先データベースファイルのパス（省略時は設定値）
+            ttl_seconds: 有効期限（秒、省略時は設定値）
+            similarity_threshold: 類似クエリとみなすコサイン類似度（省略時は設定値）
+            scan_limit: 類似クエリの判定で比較するエントリ数の上限（省略時は設定値）
+        """
+        self.path = path or config.RETRIEVAL_MEMO_PATH
+        self.ttl_seconds = config.RETRIEVAL_MEMO_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.similarity_threshold = similarity_threshold or config.RETRIEVAL_SIMILARITY_THRESHOLD
+        self.scan_limit = scan_limit or config.RETRIEVAL_MEMO_SCAN_LIMIT
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS retrievals (
+                key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                query_type TEXT NOT NULL,
+                shape TEXT NOT NULL,
+                chunks TEXT NOT NULL,
+                chunk_vectors BLOB,
+                vector BLOB,
+                cached_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS retrievals_type ON retrievals (query_type, shape, cached_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 の接続はスレッド間で共有できないため、スレッドごとに保持する
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> dict:
+        chunks = json.loads(row["chunks"])
+        # チャンクのベクトル（content_vector）は float32 の連結で保存し、dimensions の次元ずつ戻す
+        vectors = array("f", row["chunk_vectors"] or b"")
+        offset = 0
+        for chunk in chunks:
+            dimensions = chunk.pop("dimensions", 0)
+            if dimensions:
+                chunk["content_vector"] = vectors[offset:offset + dimensions].tolist()
+                offset += dimensions
+        return {
+            "key": row["key"],
+            "query": row["query"],
+            "query_type": row["query_type"],
+            "shape": row["shape"],
+            "chunks": chunks,
+        }
+
+    def lookup(self, query: str, query_type: str, vector: list[float] | None = None,
+               shape: str = "") -> dict | None:
+        """
+        同じクエリ、または類似クエリの検索結果を返す。なければNone。
+        """
+        conn = self._connect()
+        oldest = time.time() - self.ttl_seconds
+        row = conn.execute(
+            "SELECT * FROM retrievals WHERE key = ? AND cached_at >= ?",
+            (memo_key(query, query_type, shape), oldest),
+        ).fetchone()
+        if row is not None:
+            return self._entry(row)
+        if vector is None:
+            return None
+
+        rows = conn.execute(
+            "SELECT key, vector FROM retrievals"
+            " WHERE query_type = ? AND shape = ? AND cached_at >= ? AND vector IS NOT NULL"
+            " ORDER BY cached_at DESC LIMIT ?",
+            (query_type, shape, oldest, self.scan_limit),
+        ).fetchall()
+        # 次元数の異なるベクトル（埋め込みモデルの変更前のエントリ）は比較しない
+        rows = [r for r in rows if len(r["vector"]) == len(vector) * 4]
+        if not rows:
+            return None
+
+        # 類似度はまとめて行列積で計算する（numpy は起動時間に影響するため、ここで読み込む）
+        import numpy as np
+        matrix = np.frombuffer(b"".join(r["vector"] for r in rows), dtype=np.float32).reshape(len(rows), -1)
+        query_vector = np.asarray(vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector)
+        scores = (matrix @ query_vector) / np.where(norms > 0, norms, 1.0)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        row = conn.execute("SELECT * FROM retrievals WHERE key = ?", (rows[best]["key"],)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def store(self, query: str, query_type: str, chunks: list[dict], vector: list[float] | None = None,
+              shape: str = "") -> None:
+        """
+        検索結果を保存する（このクエリの行のみを追加・更新し、期限切れの行は削除する）。
+        """
+        now = time.time()
+        # 共有メモから取得したチャンクも MMR で詰め込めるよう、content_vector はバイナリで保存する
+        records = []
+        vectors = array("f")
+        for chunk in chunks:
+            record = {k: v for k, v in chunk.items() if k != "content_vector"}
+            if chunk.get("content_vector"):
+                record["dimensions"] = len(chunk["content_vector"])
+                vectors.extend(chunk["content_vector"])
+            records.append(record)
+
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO retrievals (key, query, query_type, shape, chunks, chunk_vectors, vector, cached_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET query = excluded.query, chunks = excluded.chunks,"
+            " chunk_vectors = excluded.chunk_vectors, vector = excluded.vector, cached_at = excluded.cached_at",
+            (
+                memo_key(query, query_type, shape),
+                query,
+                query_type,
+                shape,
+                json.dumps(records, ensure_ascii=False),
+                vectors.tobytes() if vectors else None,
+                array("f", vector).tobytes() if vector is not None else None,
+                now,
+            ),
+        )
+        conn.execute("DELETE FROM retrievals WHERE cached_at < ?", (now - self.ttl_seconds,))
+
+
+# %%
+class RetrievalMemo:
+    """
+    1セッション内の検索結果メモ。
+
+    エントリ（クエリ・検索方式・取得したチャンクID）はセッション状態に保存し、
+    チェックポイントから再開した場合も同じクエリを再検索しない。
+    クエリのベクトルと取得したチャンクの本文はチェックポイントに含めず、このプロセス内でのみ保持する
+    （チャンクは詰め込みで選ばれなかったものを後のイテレーションで渡すために使う）。
+    """
+
+    def __init__(self, entries: list[dict] | None = None, embed=None,
+                 similarity_threshold: float | None = None, shared: SharedRetrievalMemo | None = None):
+        """
+        Args:
+            entries: セッション状態のエントリ一覧（このリストを直接更新する）
+            embed: クエリをベクトル化する関数（省略時、またはNoneを返す場合は類似クエリを判定しない）
+            similarity_threshold: 類似クエリとみなすコサイン類似度（省略時は設定値）
+            shared: セッションをまたいだメモ（省略時はセッション内のみ）
+        """
+        self.entries = entries if entries is not None else []
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold or config.RETRIEVAL_SIMILARITY_THRESHOLD
+        self.shared = shared
+        self._vectors: dict[str, list[float] | None] = {}
+        self._chunks: dict[str, list[dict]] = {}
+
+    def vector(self, query: str) -> list[float] | None:
+        """
+        クエリのベクトルを返す（正規化したクエリごとに1回だけ計算する）。
+        """
+        if self.embed is None:
+            return None
+        key = normalize_query(query)
+        if key not in self._vectors:
+            self._vectors[key] = self.embed(query)
+        return self._vectors[key]
+
+    def chunks(self, entry: dict) -> list[dict]:
+        """
+        エントリの検索で取得したチャンクを返す（チェックポイントから再開した場合など、保持していなければ空）。
+        """
+        return self._chunks.get(entry["key"], [])
+
+    def lookup(self, query: str, query_type: str, shape: str = "") -> tuple[dict | None, str | None]:
+        """
+        検索済みのクエリを探す（取得件数・取得フィールドが異なる検索結果は対象外）。
+
+        Args:
+            shape: fetch_shape で作成した取得の仕方
+
+        Returns:
+            tuple: (エントリ, 一致の種類)。一致の種類は exact / similar / shared、
+                見つからなければ (None, None)
+        """
+        key = memo_key(query, query_type, shape)
+        for entry in self.entries:
+            if entry["key"] == key:
+                return entry, "exact"
+
+        vector = self.vector(query)
+        if vector is not None:
+            entry = _most_similar(
+                self.entries, query_type, shape, vector, lambda e: self.vector(e["query"]), self.similarity_threshold
+            )
+            if entry is not None:
+                return entry, "similar"
+
+        if self.shared is not None:
+            entry = self.shared.lookup(query, query_type, vector, shape)
+            if entry is not None:
+                return entry, "shared"
+        return None, None
+
+    def store(self, query: str, query_type: str, chunks: list[dict], shape: str = "", share: bool = True) -> None:
+        """
+        検索結果を記録する。
+
+        Args:
+            shape: fetch_shape で作成した取得の仕方
+            share: セッションをまたいだメモにも保存するか
+        """
+        key = memo_key(query, query_type, shape)
+        self._chunks[key] = chunks
+        self.entries.append({
+            "key": key,
+            "query": query,
+            "query_type": query_type,
+            "shape": shape,
+            "chunk_ids": [chunk["id"] for chunk in chunks],
+        })
+        if share and self.shared is not None:
+            self.shared.store(query, query_type, chunks, self.vector(query), shape)
+
+
+# %%
+def create_retriever() -> SearchRetriever | None:
+    """
+    設定値から Retriever を生成する。
+    根拠の事前取得が無効、または検索の接続情報がない場合はNone。
+    """
+    if not config.RETRIEVAL_PREFETCH:
+        return None
+    if not (config.AZURE_AI_SEARCH_ENDPOINT and config.AZURE_AI_SEARCH_API_KEY):
+        return None
+
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+
+    search_client = SearchClient(
+        endpoint=config.AZURE_AI_SEARCH_ENDPOINT,
+        index_name=config.AZURE_AI_SEARCH_INDEX_NAME,
+        credential=AzureKeyCredential(config.AZURE_AI_SEARCH_API_KEY),
+        retry_total=0,
+    )
+
+    embedding_client = None
+    if config.AZURE_OPENAI_API_ENDPOINT and config.AZURE_OPENAI_API_KEY:
+        from openai import AzureOpenAI
+        embedding_client = AzureOpenAI(
+            azure_endpoint=config.AZURE_OPENAI_API_ENDPOINT,
+            api_key=config.AZURE_OPENAI_API_KEY,
+            api_version=config.AZURE_OPENAI_API_VERSION,
+            max_retries=0,
+        )
+    return SearchRetriever(search_client, embedding_client)
+
+
+def create_shared_memo() -> SharedRetrievalMemo | None:
+    """
+    設定値からセッションをまたいだメモを生成する。保存先が未設定の場合はNone。
+    """
+    if not config.RETRIEVAL_MEMO_PATH:
+        return None
+    return SharedRetrievalMemo()
@@ -9,11 +9,43 @@ Planner → Researcher → Critic のループを実行し、
 """
 
 import json
+import threading
 import time
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
+from concurrent.futures import ThreadPoolExecutor
 
 import config
+from checkpoint import CheckpointStore, make_session_id, new_session_state
+from client_factory import AgentCache, get_project_client
+from rate_limiter import Priority, ThrottledError, estimate_tokens, get_scheduler, retry_after_from_message
+from retrieval import SELECT_FIELDS, RetrievalMemo, create_retriever, create_shared_memo, fetch_shape
+
+
+# %%
+def extract_json(text: str) -> str:
+    """
+    エージェントの応答からJSON部分を取り出す（マークダウンのコードブロック内にある場合も対応）。
+    """
+    if "```json" in text:
+        return text.split("```json")[1].split("```")[0]
+    if "```" in text:
+        return text.split("```")[1].split("```")[0]
+    return text
+
+
+def parse_sub_queries(plan_response: str) -> list[str]:
+    """
+    Planner の調査計画からサブクエリを取り出す。解析できない場合は空のリスト。
+    """
+    try:
+        plan = json.loads(extract_json(plan_response))
+    except json.JSONDecodeError:
+        return []
+    if not isinstance(plan, dict):
+        return []
+    return [
+        q["query"] for q in plan.get("sub_queries", [])
+        if isinstance(q, dict) and isinstance(q.get("query"), str) and q["query"].strip()
+    ]
 
 
 # %%
@@ -22,148 +54,435 @@ class DeepResearchRunner:
     Deep Researchのマルチエージェントループを実行するクラス。
     """
     
-    def __init__(self):
+    def __init__(self, client=None, agent_ids: dict[str, str] | None = None, scheduler=None,
+                 checkpoints: CheckpointStore | None = None, agent_cache: AgentCache | None = None,
+                 retriever=None, shared_memo=None):
         """
-        クライアントと既存エージェントを初期化する。
+        クライアントを初期化する。エージェントは初回使用時にまとめて取得する。
+
+        Args:
+            client: 使用するクライアント（省略時はプロセス共通のAIProjectClient）。
+                ベンチマーク等ではシミュレーション用のクライアントを渡す。
+            agent_ids: create_agents() と同じ形式のエージェントID辞書
+                （省略時は設定値を使用）
+            scheduler: レート制限・再試行に使用するスケジューラ
+                （省略時はプロセス共通のスケジューラ）
+            checkpoints: セッション状態の保存先（省略時は設定値のディレクトリ）
+            agent_cache: エージェント情報のキャッシュ（省略時は設定値のファイル）
+            retriever: Researcher の実行前に根拠を取得する SearchRetriever
+                （省略時は RETRIEVAL_PREFETCH が有効な場合のみ設定値から生成）
+            shared_memo: セッションをまたいだ検索結果メモ
+                （省略時は RETRIEVAL_MEMO_PATH が設定されている場合のみ生成）
         """
-        # 設定の検証
-        if not config.validate_config():
-            raise ValueError("設定が不正です。.envファイルを確認してください。")
+        start = time.perf_counter()
+        self.startup_timings: dict[str, float] = {}
+        
+        if client is None:
+            # 設定の検証
+            if not config.validate_config():
+                raise ValueError("設定が不正です。.envファイルを確認してください。")
+        
+        agent_ids = agent_ids or {
+            "PLANNER_AGENT_ID": config.PLANNER_AGENT_ID,
+            "RESEARCHER_AGENT_ID": config.RESEARCHER_AGENT_ID,
+            "CRITIC_AGENT_ID": config.CRITIC_AGENT_ID,
+        }
         
         # エージェントIDの検証
-        if not all([config.PLANNER_AGENT_ID, config.RESEARCHER_AGENT_ID, config.CRITIC_AGENT_ID]):
+        if not all(agent_ids.values()):
             raise ValueError(
                 "エージェントIDが設定されていません。"
                 "先に create_agents.py を実行してください。"
             )
+        self.agent_ids = agent_ids
         
         # クライアントの初期化
-        credential = DefaultAzureCredential()
-        self.client = AIProjectClient(
-            endpoint=config.AZURE_AI_PROJECT_CONNECTION_STRING,
-            credential=credential,
-        )
-        
-        # 既存エージェントの取得
-        self.planner = self.client.agents.get_agent(config.PLANNER_AGENT_ID)
-        self.researcher = self.client.agents.get_agent(config.RESEARCHER_AGENT_ID)
-        self.critic = self.client.agents.get_agent(config.CRITIC_AGENT_ID)
+        self.client = client or get_project_client()
+        self.scheduler = scheduler or get_scheduler()
+        self.checkpoints = checkpoints or CheckpointStore()
+        self.agent_cache = agent_cache or AgentCache()
+        if client is None:
+            retriever = retriever or create_retriever()
+            shared_memo = shared_memo or create_shared_memo()
+        self.retriever = retriever
+        self.shared_memo = shared_memo
         
-        print("エージェントを読み込みました。")
+        self._agents = None
+        self._agents_lock = threading.Lock()
+        self.startup_timings["init"] = time.perf_counter() - start
+    
+    # %%
+    def _get_agents(self) -> dict:
+        """
+        エージェントを取得する（初回のみ）。
+        キャッシュにないエージェントは並行して取得する。
+
+        Returns:
+            dict: エージェントIDのキー（PLANNER_AGENT_ID 等）ごとのエージェント
+        """
+        with self._agents_lock:
+            if self._agents is not None:
+                return self._agents
+            
+            start = time.perf_counter()
+            agents = {key: self.agent_cache.get(agent_id) for key, agent_id in self.agent_ids.items()}
+            missing = [key for key, agent in agents.items() if agent is None]
+            if missing:
+                with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                    fetched = executor.map(
+                        lambda key: self.client.agents.get_agent(self.agent_ids[key]), missing
+                    )
+                    for key, agent in zip(missing, fetched):
+                        agents[key] = agent
+                        self.agent_cache.put(agent)
+            
+            self._agents = agents
+            self.startup_timings["agents"] = time.perf_counter() - start
+            self.startup_timings["agents_from_cache"] = len(agents) - len(missing)
+            print("エージェントを読み込みました。")
+            return self._agents
+    
+    @property
+    def planner(self):
+        return self._get_agents()["PLANNER_AGENT_ID"]
+    
+    @property
+    def researcher(self):
+        return self._get_agents()["RESEARCHER_AGENT_ID"]
+    
+    @property
+    def critic(self):
+        return self._get_agents()["CRITIC_AGENT_ID"]
+    
+    def warm_up(self) -> dict[str, float]:
+        """
+        エージェントを事前に取得し、起動時間の内訳を返す。
+
+        Returns:
+            dict[str, float]: 初期化（init）とエージェント取得（agents）の秒数
+        """
+        self._get_agents()
+        return dict(self.startup_timings)
     
     # %%
-    def _run_agent(self, agent, message: str) -> str:
+    def _run_agent(self, agent, message: str, thread_ids: list[str] | None = None) -> str:
         """
         指定されたエージェントでメッセージを処理する。
 
         Args:
             agent: 実行するエージェント
             message: 送信するメッセージ
+            thread_ids: 作成したスレッドIDを記録するリスト
 
         Returns:
             str: エージェントの応答
         """
-        # スレッドの作成
-        thread = self.client.agents.threads.create()
+        # スレッドの作成・メッセージの送信・応答の取得はモデルを呼び出さないため、
+        # chat のクォータを消費しない "agents" として再試行する
+        thread = self.scheduler.call("agents", self.client.agents.threads.create, priority=Priority.INTERACTIVE)
+        if thread_ids is not None:
+            thread_ids.append(thread.id)
         
         # メッセージの送信
-        self.client.agents.messages.create(
+        self.scheduler.call(
+            "agents",
+            self.client.agents.messages.create,
             thread_id=thread.id,
             role="user",
-            content=message
+            content=message,
+            priority=Priority.INTERACTIVE,
         )
         
-        # 実行
-        run = self.client.agents.runs.create(
-            thread_id=thread.id,
-            agent_id=agent.id
+        # 実行（レート制限に従い、スロットリングで失敗した場合は同じスレッドで再実行）
+        run = self.scheduler.call(
+            "chat",
+            self._execute_run,
+            thread.id,
+            agent.id,
+            tokens=estimate_tokens(message),
+            priority=Priority.INTERACTIVE,
         )
         
-        # 完了まで待機
-        while run.status in ["queued", "in_progress"]:
-            time.sleep(1)
-            run = self.client.agents.runs.get(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-        
         if run.status != "completed":
             raise RuntimeError(f"エージェント実行に失敗しました: {run.status}")
         
         # 応答の取得（assistantロールの最後のメッセージを取得）
-        response_text = self.client.agents.messages.get_last_message_text_by_role(
+        response_text = self.scheduler.call(
+            "agents",
+            self.client.agents.messages.get_last_message_text_by_role,
             thread_id=thread.id,
-            role="assistant"
+            role="assistant",
+            priority=Priority.INTERACTIVE,
         )
         return response_text.text.value
     
+    def _execute_run(self, thread_id: str, agent_id: str):
+        """
+        実行を作成して完了まで待機する。
+
+        スケジューラはこの関数全体を再試行するため、再試行で新しい実行を作成するのは
+        作成自体が失敗した場合と、実行がレート制限で失敗した場合のみとする。
+        実行中の状態取得の一時的なエラーは状態取得のみを再試行し、
+        再試行しきれない場合は再試行不可のエラーとする（同じスレッドで実行中の実行があるため）。
+
+        Args:
+            thread_id: スレッドID
+            agent_id: エージェントID
+
+        Returns:
+            終了状態の実行
+
+        Raises:
+            ThrottledError: レート制限により実行が失敗した場合
+            RuntimeError: 実行の状態を取得できなかった場合
+        """
+        run = self.client.agents.runs.create(
+            thread_id=thread_id,
+            agent_id=agent_id
+        )
+        
+        # 完了まで待機（状態取得は "agents" として再試行し、chat のクォータは消費しない）
+        try:
+            while run.status in ["queued", "in_progress"]:
+                time.sleep(config.RUN_POLL_INTERVAL_SECONDS)
+                run = self.scheduler.call(
+                    "agents",
+                    self.client.agents.runs.get,
+                    thread_id=thread_id,
+                    run_id=run.id,
+                    priority=Priority.INTERACTIVE,
+                )
+        except Exception as e:
+            raise RuntimeError(f"エージェント実行の状態を取得できませんでした（run: {run.id}）: {e}") from e
+        
+        last_error = getattr(run, "last_error", None)
+        if run.status == "failed" and last_error and last_error.code == "rate_limit_exceeded":
+            raise ThrottledError(
+                f"エージェント実行がレート制限されました: {last_error.message}",
+                retry_after=retry_after_from_message(last_error.message),
+            )
+        return run
+    
+    # %%
+    def _prefetch_evidence(self, plan_response: str, state: dict, memo: RetrievalMemo) -> str:
+        """
+        調査計画のサブクエリを検索し、Researcher に渡す新しい根拠を整形する。
+
+        検索済みのクエリ（完全一致・類似クエリ）は再検索せず、
+        これまでに渡したチャンクは除外する。RETRIEVAL_CONTEXT_TOKENS が設定されている場合は
+        候補を多めに取得し、MMR で選んだチャンクを上限のトークン数まで詰める。
+
+        Args:
+            plan_response: Planner の調査計画
+            state: セッション状態（seen_chunk_ids を更新する）
+            memo: セッションの検索結果メモ（state["retrievals"] を更新する）
+
+        Returns:
+            str: Researcher の入力に追加するテキスト（サブクエリがない場合は空文字列）
+        """
+        queries = parse_sub_queries(plan_response)
+        if not queries:
+            return ""
+        
+        seen = set(state.setdefault("seen_chunk_ids", []))
+        query_type = self.retriever.query_type
+        packing = config.RETRIEVAL_CONTEXT_TOKENS > 0
+        search_options = (
+            {"top_k": config.RETRIEVAL_CANDIDATES, "select": SELECT_FIELDS + ["content_vector"]} if packing else {}
+        )
+        # 取得件数・取得フィールドが異なる検索結果は再利用しないよう、取得の仕方をメモのキーに含める
+        shape = fetch_shape(
+            search_options.get("top_k") or self.retriever.top_k, search_options.get("select") or SELECT_FIELDS
+        )
+        candidates = {}
+        searched = []
+        
+        for query in queries:
+            entry, match = memo.lookup(query, query_type, shape)
+            if match in ("exact", "similar"):
+                # このセッションで取得済みの結果は再検索せず、詰め込みで選ばれなかったチャンクだけを候補に戻す
+                searched.append(query if match == "exact" else f"{query}（類似: {entry['query']}）")
+                chunks = memo.chunks(entry)
+            elif match == "shared":
+                chunks = entry["chunks"]
+                memo.store(query, query_type, chunks, shape, share=False)
+            else:
+                chunks = self.retriever.search(query, vector=memo.vector(query), **search_options)
+                memo.store(query, query_type, chunks, shape)
+            for chunk in chunks:
+                if chunk["id"] not in seen and chunk["id"] not in candidates:
+                    candidates[chunk["id"]] = {"query": query, **chunk}
+        
+        if packing:
+            # numpy の読み込みは起動時間に影響するため、詰め込みを行う場合のみ読み込む
+            from context_packing import pack_context
+            passages = pack_context(
+                list(candidates.values()),
+                query_vectors={query: memo.vector(query) for query in queries},
+            )
+            delivered = [chunk_id for passage in passages for chunk_id in passage["ids"]]
+            evidence = [
+                {k: v for k, v in passage.items() if k not in ("ids", "file_id")} for passage in passages
+            ]
+        else:
+            delivered = list(candidates)
+            evidence = [
+                {k: v for k, v in chunk.items() if k not in ("score", "content_vector")}
+                for chunk in candidates.values()
+            ]
+        # 詰め込みで選ばれなかったチャンクは既読にせず、以降のイテレーションで同じクエリ・類似クエリや
+        # 別のクエリの結果に含まれた場合に改めて候補にする
+        state["seen_chunk_ids"].extend(delivered)
+        
+        print(f"[Retriever] 新しい根拠 {len(evidence)} 件、検索済みのためスキップしたクエリ {len(searched)} 件")
+        sections = []
+        if evidence:
+            sections.append(
+                "## 取得済みの根拠（これまでに渡していないもののみ）\n"
+                + json.dumps(evidence, ensure_ascii=False, indent=2)
+            )
+        if searched:
+            sections.append(
+                "## 検索済みのクエリ（結果は前回までの調査結果に含まれるため再検索は不要です）\n"
+                + "\n".join(f"- {query}" for query in searched)
+            )
+        return "\n\n".join(sections)
+    
     # %%
-    def run(self, question: str) -> str:
+    def run(self, question: str, session_id: str | None = None, progress=None) -> str:
         """
         Deep Researchを実行する。
 
+        ステージごとにセッション状態をチェックポイントへ保存し、
+        同じセッションが途中で失敗していた場合は最後に完了したステージの次から再開する。
+
         Args:
             question: ユーザーの質問
+            session_id: セッションID（省略時は質問文から生成）
+            progress: 進捗の通知先 progress(stage, iteration, status)。
+                status は started / completed / restored のいずれか
 
         Returns:
             str: 最終レポート
         """
+        # セッションIDと再開時の照合は前後の空白を除いた質問で行う
+        question = question.strip()
         print("\n" + "=" * 60)
         print("Deep Research を開始します")
         print("=" * 60)
         print(f"\n質問: {question}\n")
         
+        session_id = session_id or make_session_id(question)
+        state = self.checkpoints.load(session_id)
+        if state is None:
+            state = new_session_state(session_id, question)
+        elif state["question"].strip() != question:
+            raise ValueError(f"セッション {session_id} は別の質問のチェックポイントです。")
+        else:
+            print(
+                f"チェックポイントから再開します（セッション: {session_id}、"
+                f"完了済みステージ: {len(state['plans']) + len(state['findings']) + len(state['evaluations'])}）"
+            )
+        
+        report = self._research(question, state, progress or (lambda *args: None))
+        
+        # 完了したセッションのチェックポイントは不要
+        self.checkpoints.delete(session_id)
+        return report
+    
+    def _research(self, question: str, state: dict, progress) -> str:
+        """
+        Planner → Researcher → Critic のループを実行する（完了済みのステージは保存結果を使用）。
+
+        Args:
+            question: ユーザーの質問
+            state: セッション状態（各ステージの完了時に更新・保存される）
+            progress: 進捗の通知先
+
+        Returns:
+            str: 最終レポート
+        """
         iteration = 0
-        all_findings = []
+        all_findings = state["findings"]
+        memo = None
+        if self.retriever is not None:
+            # 検索結果メモはイテレーションをまたいで共有する（チェックポイントにも保存される）
+            memo = RetrievalMemo(
+                state.setdefault("retrievals", []),
+                embed=self.retriever.embed,
+                shared=self.shared_memo,
+            )
         
         while iteration < config.MAX_RESEARCH_ITERATIONS:
             iteration += 1
             print(f"\n--- イテレーション {iteration}/{config.MAX_RESEARCH_ITERATIONS} ---\n")
             
             # Step 1: Planner - 調査計画を立てる
-            print("[Planner] 調査計画を作成中...")
-            if iteration == 1:
-                planner_input = f"以下の質問に回答するための調査計画を立ててください:\n\n{question}"
+            if len(state["plans"]) >= iteration:
+                plan_response = state["plans"][iteration - 1]
+                print("[Planner] 保存済みの計画を使用")
+                progress("planner", iteration, "restored")
             else:
-                planner_input = (
-                    f"以下の質問に回答するための追加調査が必要です:\n\n"
-                    f"質問: {question}\n\n"
-                    f"これまでの調査結果: {json.dumps(all_findings, ensure_ascii=False)}\n\n"
-                    f"不足している情報を補うための追加クエリを生成してください。"
-                )
-            
-            plan_response = self._run_agent(self.planner, planner_input)
-            print(f"[Planner] 計画完了")
+                print("[Planner] 調査計画を作成中...")
+                progress("planner", iteration, "started")
+                if iteration == 1:
+                    planner_input = f"以下の質問に回答するための調査計画を立ててください:\n\n{question}"
+                else:
+                    planner_input = (
+                        f"以下の質問に回答するための追加調査が必要です:\n\n"
+                        f"質問: {question}\n\n"
+                        f"これまでの調査結果: {json.dumps(all_findings, ensure_ascii=False)}\n\n"
+                        f"不足している情報を補うための追加クエリを生成してください。"
+                    )
+                
+                plan_response = self._run_agent(self.planner, planner_input, state["thread_ids"])
+                state["plans"].append(plan_response)
+                self.checkpoints.save(state)
+                print(f"[Planner] 計画完了")
+                progress("planner", iteration, "completed")
             
             # Step 2: Researcher - 情報を検索
-            print("[Researcher] 情報を検索中...")
-            researcher_input = (
-                f"以下の調査計画に基づいて情報を検索してください:\n\n{plan_response}"
-            )
-            research_response = self._run_agent(self.researcher, researcher_input)
-            all_findings.append(research_response)
-            print(f"[Researcher] 検索完了")
+            if len(all_findings) >= iteration:
+                print("[Researcher] 保存済みの検索結果を使用")
+                progress("researcher", iteration, "restored")
+            else:
+                print("[Researcher] 情報を検索中...")
+                progress("researcher", iteration, "started")
+                researcher_input = (
+                    f"以下の調査計画に基づいて情報を検索してください:\n\n{plan_response}"
+                )
+                if self.retriever is not None:
+                    evidence = self._prefetch_evidence(plan_response, state, memo)
+                    if evidence:
+                        researcher_input += f"\n\n{evidence}"
+                research_response = self._run_agent(self.researcher, researcher_input, state["thread_ids"])
+                all_findings.append(research_response)
+                self.checkpoints.save(state)
+                print(f"[Researcher] 検索完了")
+                progress("researcher", iteration, "completed")
             
             # Step 3: Critic - 情報を評価
-            print("[Critic] 情報を評価中...")
-            critic_input = (
-                f"以下の情報が元の質問に十分に回答できるか評価してください:\n\n"
-                f"質問: {question}\n\n"
-                f"収集された情報: {json.dumps(all_findings, ensure_ascii=False)}"
-            )
-            critic_response = self._run_agent(self.critic, critic_input)
-            print(f"[Critic] 評価完了")
+            if len(state["evaluations"]) >= iteration:
+                critic_response = state["evaluations"][iteration - 1]
+                print("[Critic] 保存済みの評価を使用")
+                progress("critic", iteration, "restored")
+            else:
+                print("[Critic] 情報を評価中...")
+                progress("critic", iteration, "started")
+                critic_input = (
+                    f"以下の情報が元の質問に十分に回答できるか評価してください:\n\n"
+                    f"質問: {question}\n\n"
+                    f"収集された情報: {json.dumps(all_findings, ensure_ascii=False)}"
+                )
+                critic_response = self._run_agent(self.critic, critic_input, state["thread_ids"])
+                state["evaluations"].append(critic_response)
+                self.checkpoints.save(state)
+                print(f"[Critic] 評価完了")
+                progress("critic", iteration, "completed")
             
             # 判断を解析
             try:
-                # JSONを抽出（マークダウンのコードブロック内にある場合も対応）
-                json_match = critic_response
-                if "```json" in critic_response:
-                    json_match = critic_response.split("```json")[1].split("```")[0]
-                elif "```" in critic_response:
-                    json_match = critic_response.split("```")[1].split("```")[0]
-                
-                evaluation = json.loads(json_match)
+                evaluation = json.loads(extract_json(critic_response))
                 
                 if evaluation.get("decision") == "COMPLETE":
                     print("\n[Critic] 調査完了と判断しました。")
@@ -187,7 +506,27 @@ class DeepResearchRunner:
             f"## 質問\n{question}\n\n"
             f"## 収集された情報\n{json.dumps(all_findings, ensure_ascii=False, indent=2)}"
         )
-        return self._run_agent(self.planner, final_input)  # Plannerを使用して統合
+        progress("report", iteration, "started")
+        report = self._run_agent(self.planner, final_input, state["thread_ids"])  # Plannerを使用して統合
+        progress("report", iteration, "completed")
+        return report
+
+
+# %%
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> DeepResearchRunner:
+    """
+    プロセス共通の DeepResearchRunner を返す（初回のみ生成）。
+    常駐ワーカーやバッチ処理では初期化コストを1回だけ支払う。
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = DeepResearchRunner()
+        return _runner
 
 
 # %%
@@ -196,14 +535,26 @@ if __name__ == "__main__":
     print("Deep Research Agent")
     print("=" * 60)
     
+    # 質問の入力を待つ間にエージェントを取得しておく
+    runner = get_runner()
+    warm_up = threading.Thread(target=runner.warm_up, daemon=True)
+    warm_up.start()
+    
     # ターミナルから質問を入力
-    question = input("\n調査したい質問を入力してください:\n> ")
+    question = input("\n調査したい質問を入力してください:\n> ").strip()
     
-    if not question.strip():
+    if not question:
         print("質問が入力されていません。終了します。")
         exit(1)
     
-    runner = DeepResearchRunner()
+    warm_up.join()
+    timings = runner.startup_timings
+    print(
+        f"起動時間: 初期化 {timings['init']:.2f} 秒 / "
+        f"エージェント取得 {timings.get('agents', 0.0):.2f} 秒"
+        f"（キャッシュ {timings.get('agents_from_cache', 0)}/3）"
+    )
+    
     result = runner.run(question)
     
     print("\n" + "=" * 60)
@@ -0,0 +1,410 @@
+# %%
+"""
+Deep Research HTTP サービス
+
+DeepResearchRunner をHTTPのジョブサービスとして提供する。
+1つのプロセス内で共通のRunner（クライアント・エージェント）を再利用し、
+固定数のワーカーが上限付きのキューからジョブを処理する。
+
+エンドポイント:
+- POST /jobs                 ジョブを投入（{"question": "..."}）。キューが満杯なら 429
+- GET  /jobs/{id}            ジョブの状態
+- GET  /jobs/{id}/result     最終レポート（未完了の場合は 202）
+- GET  /jobs/{id}/events     進捗イベント（Server-Sent Events）
+- GET  /healthz              キューとワーカーの状態
+
+    python service.py --port 8000
+    python service.py --simulated   # Azureリソースなしで動作確認
+"""
+
+import argparse
+import json
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import config
+
+
+# %%
+class QueueFullError(Exception):
+    """
+    キューが満杯でジョブを受け付けられないことを表す例外。
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("ジョブキューが満杯です。")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    """
+    1件の調査ジョブ。
+    """
+    id: str
+    question: str
+    status: str = "queued"
+    result: str | None = None
+    error: str | None = None
+    events: list[dict] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    changed: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def add_event(self, event: str, **data) -> None:
+        with self.changed:
+            self.events.append({"event": event, "time": time.time(), **data})
+            self.changed.notify_all()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "question": self.question,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "events": len(self.events),
+        }
+
+
+# %%
+class JobManager:
+    """
+    上限付きキューとワーカースレッドでジョブを処理する。
+    """
+
+    def __init__(self, runner, workers: int, max_queue: int, job_ttl_seconds: int):
+        """
+        Args:
+            runner: 全ワーカーで共有する DeepResearchRunner
+            workers: ワーカースレッド数
+            max_queue: 待機できるジョブの上限（超えた場合は受け付けない）
+            job_ttl_seconds: 終了したジョブを保持する秒数
+
+        Raises:
+            ValueError: workers または max_queue が1未満の場合
+                （queue.Queue は maxsize が0以下だと上限なしになり、受け付けの制限が効かないため）
+        """
+        if workers < 1:
+            raise ValueError(f"ワーカー数は1以上を指定してください: {workers}")
+        if max_queue < 1:
+            raise ValueError(f"待機ジョブの上限は1以上を指定してください: {max_queue}")
+        self.runner = runner
+        self.workers = workers
+        self.job_ttl_seconds = job_ttl_seconds
+        self._queue: queue.Queue[Job] = queue.Queue(maxsize=max_queue)
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._durations: list[float] = []
+        self._threads = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"research-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _estimate_retry_after(self) -> int:
+        """
+        直近のジョブ所要時間から、キューに空きが出るまでの秒数を見積もる。
+        """
+        with self._lock:
+            recent = self._durations[-20:]
+        average = sum(recent) / len(recent) if recent else 30.0
+        return max(1, round(average / self.workers))
+
+    def submit(self, question: str) -> Job:
+        """
+        ジョブを投入する。
+
+        Raises:
+            QueueFullError: キューが満杯の場合
+        """
+        self._purge()
+        job = Job(id=uuid.uuid4().hex, question=question)
+        job.add_event("queued")
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError(self._estimate_retry_after())
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max_queue": self._queue.maxsize,
+                "running": self._running,
+                "workers": self.workers,
+                "jobs": len(self._jobs),
+            }
+
+    def _purge(self) -> None:
+        """
+        保持期間を過ぎた終了済みジョブを削除する。
+        """
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished and now - job.finished_at > self.job_ttl_seconds
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            job.status = "running"
+            job.started_at = time.time()
+            job.add_event("started")
+            try:
+                job.result = self.runner.run(
+                    job.question,
+                    session_id=job.id,
+                    progress=lambda stage, iteration, status: job.add_event(
+                        "stage", stage=stage, iteration=iteration, status=status
+                    ),
+                )
+                status = "completed"
+            except Exception as e:
+                job.error = str(e)
+                status = "failed"
+                # ジョブIDのセッションは再開されないため、失敗時のチェックポイントは残さない
+                self.runner.checkpoints.delete(job.id)
+            # 終了状態と終了イベントは同時に反映し、SSE の読み手が終了イベントを取りこぼさないようにする
+            with job.changed:
+                job.status = status
+                job.finished_at = time.time()
+                job.add_event(status)
+            with self._lock:
+                self._running -= 1
+                self._durations.append(job.finished_at - job.started_at)
+                del self._durations[:-100]
+            self._queue.task_done()
+
+
+# %%
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    ジョブサービスのリクエストハンドラ。
+    """
+
+    server_version = "DeepResearchService/1.0"
+
+    @property
+    def manager(self) -> JobManager:
+        return self.server.manager
+
+    def _send_json(self, status: int, payload: dict, headers: dict[str, str] | None = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, headers: dict[str, str] | None = None) -> None:
+        self._send_json(status, {"error": message}, headers)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/jobs":
+            self._error(404, "Not found")
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            self._error(400, "リクエストボディはJSONで指定してください。")
+            return
+
+        question = body.get("question", "") if isinstance(body, dict) else ""
+        if not isinstance(question, str) or not question.strip():
+            self._error(400, "question を指定してください。")
+            return
+
+        try:
+            job = self.manager.submit(question.strip())
+        except QueueFullError as e:
+            self._error(429, str(e), headers={"Retry-After": str(e.retry_after)})
+            return
+
+        self._send_json(
+            202,
+            {
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.id}",
+                "result_url": f"/jobs/{job.id}/result",
+                "events_url": f"/jobs/{job.id}/events",
+            },
+            headers={"Location": f"/jobs/{job.id}"},
+        )
+
+    def do_GET(self):
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if parts == ["healthz"]:
+            self._send_json(200, self.manager.stats())
+            return
+        if len(parts) < 2 or parts[0] != "jobs" or len(parts) > 3:
+            self._error(404, "Not found")
+            return
+
+        job = self.manager.get(parts[1])
+        if job is None:
+            self._error(404, "ジョブが見つかりません。")
+            return
+
+        action = parts[2] if len(parts) == 3 else None
+        if action is None:
+            self._send_json(200, job.to_dict())
+        elif action == "result":
+            self._send_result(job)
+        elif action == "events":
+            self._stream_events(job)
+        else:
+            self._error(404, "Not found")
+
+    def _send_result(self, job: Job) -> None:
+        if job.status == "completed":
+            self._send_json(200, {"job_id": job.id, "status": job.status, "report": job.result})
+        elif job.status == "failed":
+            self._send_json(500, {"job_id": job.id, "status": job.status, "error": job.error})
+        else:
+            self._send_json(202, {"job_id": job.id, "status": job.status}, headers={"Retry-After": "5"})
+
+    def _stream_events(self, job: Job) -> None:
+        """
+        進捗イベントを Server-Sent Events で送信する（終了イベントの送信まで）。
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        index = 0
+        try:
+            while True:
+                with job.changed:
+                    # 接続維持のため、一定時間イベントがなければコメントを送る
+                    if not job.changed.wait_for(lambda: len(job.events) > index, timeout=15):
+                        self.wfile.write(b": keepalive\n\n")
+                        self.wfile.flush()
+                        continue
+                    event = job.events[index]
+                data = json.dumps(event, ensure_ascii=False)
+                self.wfile.write(f"id: {index}\nevent: {event['event']}\ndata: {data}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                index += 1
+                # 終了イベント（completed / failed）を送信したら終了する
+                if event["event"] in ("completed", "failed"):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        print(f"[HTTP] {self.address_string()} {format % args}")
+
+
+class ResearchServer(ThreadingHTTPServer):
+    """
+    JobManager を保持するHTTPサーバー。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, manager: JobManager):
+        super().__init__(address, ServiceHandler)
+        self.manager = manager
+
+
+# %%
+def create_runner(simulated: bool):
+    """
+    サービスで共有するRunnerを生成し、エージェントを事前に取得する。
+
+    Args:
+        simulated: シミュレーション用バックエンドを使用するか
+    """
+    if simulated:
+        from checkpoint import CheckpointStore
+        from client_factory import AgentCache
+        from run_deep_research import DeepResearchRunner
+        from benchmarks.simulated_agents import SimulatedProjectClient
+
+        config.RUN_POLL_INTERVAL_SECONDS = min(config.RUN_POLL_INTERVAL_SECONDS, 0.05)
+        client = SimulatedProjectClient()
+        runner = DeepResearchRunner(
+            client=client,
+            agent_ids=client.agent_ids,
+            checkpoints=CheckpointStore(tempfile.mkdtemp(prefix="service-checkpoints-")),
+            agent_cache=AgentCache(persist=False),
+        )
+    else:
+        from run_deep_research import get_runner
+        runner = get_runner()
+    runner.warm_up()
+    return runner
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deep Research HTTP サービス")
+    parser.add_argument("--host", default=config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVICE_WORKERS, help="ワーカースレッド数")
+    parser.add_argument("--max-queue", type=int, default=config.SERVICE_MAX_QUEUE, help="待機ジョブの上限")
+    parser.add_argument("--simulated", action="store_true", help="シミュレーション用バックエンドを使用")
+    args = parser.parse_args()
+    if args.workers < 1 or args.max_queue < 1:
+        parser.error("--workers（SERVICE_WORKERS）と --max-queue（SERVICE_MAX_QUEUE）は1以上を指定してください。")
+
+    runner = create_runner(args.simulated)
+    manager = JobManager(
+        runner,
+        workers=args.workers,
+        max_queue=args.max_queue,
+        job_ttl_seconds=config.SERVICE_JOB_TTL_SECONDS,
+    )
+    manager.start()
+
+    server = ResearchServer((args.host, args.port), manager)
+    print(f"Deep Research サービスを起動しました: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n終了します。")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
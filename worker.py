@@ -0,0 +1,261 @@
+# %%
+"""
+分散ワーカースクリプト
+
+ジョブキューから調査（research）やデータ取り込み（ingest）のジョブをリースして処理する。
+ワーカーはプロセス・ノードをまたいで何台でも起動でき、処理中はハートビートで
+リースを延長する。リースが切れたジョブは他のワーカーが再処理する。
+
+    # ジョブの投入
+    python worker.py submit-research "調査したい質問"
+    python worker.py submit-ingest Tools/files
+
+    # ワーカーの起動（プロセスごとに1つ、必要な数だけ起動する）
+    python worker.py work --kinds research,ingest
+
+    # 状態の確認
+    python worker.py status [JOB_ID]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import pathlib
+import threading
+import time
+import uuid
+
+# Toolsディレクトリをパスに追加（取り込み処理を再利用するため）
+ROOT_DIR = pathlib.Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / "Tools"))
+
+import config
+from job_queue import JobQueue, LeasedJob, open_queue
+
+
+# %%
+class Worker:
+    """
+    ジョブキューからジョブを取得して処理するワーカー。
+    """
+
+    def __init__(self, queue: JobQueue, kinds: list[str], lease_seconds: float | None = None,
+                 simulated: bool = False):
+        """
+        Args:
+            queue: ジョブキュー
+            kinds: 処理するジョブの種類（research / ingest）
+            lease_seconds: リースの有効期間（秒、省略時は設定値）
+            simulated: 調査ジョブをシミュレーション用バックエンドで処理するか
+        """
+        self.queue = queue
+        self.kinds = kinds
+        self.lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
+        self.simulated = simulated
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._runner = None
+        self._ingestion = None
+        self.handlers = {
+            "research": self._handle_research,
+            "ingest": self._handle_ingest,
+        }
+
+    # %%
+    def _get_runner(self):
+        """
+        調査用のRunnerを取得する（ワーカーごとに1回だけ初期化）。
+        """
+        if self._runner is None:
+            if self.simulated:
+                from checkpoint import CheckpointStore
+                from client_factory import AgentCache
+                from run_deep_research import DeepResearchRunner
+                from benchmarks.simulated_agents import SimulatedProjectClient
+
+                config.RUN_POLL_INTERVAL_SECONDS = min(config.RUN_POLL_INTERVAL_SECONDS, 0.01)
+                client = SimulatedProjectClient()
+                self._runner = DeepResearchRunner(
+                    client=client,
+                    agent_ids=client.agent_ids,
+                    checkpoints=CheckpointStore(),
+                    agent_cache=AgentCache(persist=False),
+                )
+            else:
+                from run_deep_research import get_runner
+                self._runner = get_runner()
+        return self._runner
+
+    def _handle_research(self, job: LeasedJob):
+        # ジョブIDをセッションIDとし、再試行時はチェックポイントから再開する
+        report = self._get_runner().run(job.payload["question"], session_id=job.id)
+        return {"report": report}
+
+    def _get_ingestion(self):
+        """
+        取り込み用のクライアントを取得する（ワーカーごとに1回だけ初期化）。
+        """
+        if self._ingestion is None:
+            import add_vector_index
+            from azure.core.credentials import AzureKeyCredential
+            from azure.search.documents import SearchClient
+            from openai import AzureOpenAI
+            from content_understanding_client import ContentUnderstandingClient
+
+            self._ingestion = {
+                "module": add_vector_index,
+                "openai": AzureOpenAI(
+                    azure_endpoint=add_vector_index.AZURE_OPENAI_ENDPOINT,
+                    api_key=add_vector_index.AZURE_OPENAI_API_KEY,
+                    api_version=add_vector_index.AZURE_OPENAI_API_VERSION,
+                    max_retries=0,
+                ),
+                "search": SearchClient(
+                    endpoint=add_vector_index.AZURE_SEARCH_ENDPOINT,
+                    index_name=add_vector_index.INDEX_NAME,
+                    credential=AzureKeyCredential(add_vector_index.AZURE_SEARCH_API_KEY),
+                    retry_total=0,
+                ),
+                "cu": ContentUnderstandingClient(api_version="2025-05-01-preview"),
+            }
+        return self._ingestion
+
+    def _handle_ingest(self, job: LeasedJob):
+        clients = self._get_ingestion()
+        module = clients["module"]
+        file_path = job.payload["file_path"]
+        file_name = job.payload.get("file_name") or os.path.basename(file_path)
+
+        if module.is_indexed(clients["search"], file_name):
+            return {"file_name": file_name, "skipped": True}
+
+        # 一部のチャンクだけが登録されるのを避け、失敗時は登録済みのチャンクを削除してファイル単位で再試行する
+        chunks, uploaded = module.ingest_file(
+            clients["cu"], clients["openai"], clients["search"], file_path, file_name, require_all=True
+        )
+        return {"file_name": file_name, "chunks": chunks, "uploaded": uploaded}
+
+    # %%
+    def _heartbeat(self, job: LeasedJob, done: threading.Event) -> None:
+        """
+        ジョブの処理中、リース期間の1/3ごとにリースを延長する。
+        """
+        while not done.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(job, self.lease_seconds):
+                print(f"[Worker] リースを失いました: {job.id}")
+                return
+
+    def process(self, job: LeasedJob) -> None:
+        """
+        1件のジョブを処理し、結果をキューに記録する。
+        """
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handlers[job.kind](job)
+        except Exception as e:
+            print(f"[Worker] ジョブ失敗 ({job.kind} {job.id}, 試行 {job.attempts}/{job.max_attempts}): {e}")
+            if self.queue.fail(job, str(e)) and job.attempts >= job.max_attempts and job.kind == "research":
+                # 再試行されなくなった調査ジョブのチェックポイントは再開されないため削除する
+                self._get_runner().checkpoints.delete(job.id)
+        else:
+            self.queue.complete(job, result)
+            print(f"[Worker] ジョブ完了 ({job.kind} {job.id})")
+        finally:
+            done.set()
+            heartbeat.join()
+
+    def run(self, poll_interval: float = 1.0, max_jobs: int | None = None, exit_when_empty: bool = False) -> int:
+        """
+        ジョブを取得して処理し続ける。
+
+        Args:
+            poll_interval: キューが空の場合の待機時間（秒）
+            max_jobs: 処理するジョブ数の上限
+            exit_when_empty: キューが空になったら終了するか
+
+        Returns:
+            int: 処理したジョブ数
+        """
+        processed = 0
+        while max_jobs is None or processed < max_jobs:
+            try:
+                job = self.queue.lease(self.kinds, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                # データベースのロック待ちのタイムアウトや Redis の切断は一時的なものとして待機後に再試行する
+                print(f"[Worker] ジョブの取得に失敗しました: {e}")
+                time.sleep(poll_interval)
+                continue
+            if job is None:
+                if exit_when_empty:
+                    break
+                time.sleep(poll_interval)
+                continue
+            self.process(job)
+            processed += 1
+        return processed
+
+
+# %%
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Deep Research 分散ワーカー")
+    parser.add_argument("--queue", default=config.JOB_QUEUE_URL, help="キューのURL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    work = subparsers.add_parser("work", help="ワーカーを起動する")
+    work.add_argument("--kinds", default="research,ingest", help="処理するジョブの種類（カンマ区切り）")
+    work.add_argument("--lease-seconds", type=float, default=config.JOB_LEASE_SECONDS)
+    work.add_argument("--exit-when-empty", action="store_true", help="キューが空になったら終了")
+    work.add_argument("--simulated", action="store_true", help="調査ジョブをシミュレーション用バックエンドで処理")
+
+    research = subparsers.add_parser("submit-research", help="調査ジョブを投入する")
+    research.add_argument("question")
+
+    ingest = subparsers.add_parser("submit-ingest", help="ディレクトリ内（サブディレクトリを含む）のファイルごとに取り込みジョブを投入する")
+    ingest.add_argument("directory")
+
+    status = subparsers.add_parser("status", help="キューまたはジョブの状態を表示する")
+    status.add_argument("job_id", nargs="?")
+
+    args = parser.parse_args()
+    queue = open_queue(args.queue)
+
+    if args.command == "work":
+        worker = Worker(
+            queue,
+            kinds=[k.strip() for k in args.kinds.split(",") if k.strip()],
+            lease_seconds=args.lease_seconds,
+            simulated=args.simulated,
+        )
+        print(f"ワーカーを起動しました: {worker.worker_id} ({', '.join(worker.kinds)})")
+        processed = worker.run(exit_when_empty=args.exit_when_empty)
+        print(f"{processed} 件のジョブを処理しました。")
+    elif args.command == "submit-research":
+        print(queue.enqueue("research", {"question": args.question}))
+    elif args.command == "submit-ingest":
+        import add_vector_index
+        count = 0
+        for file_path in add_vector_index.discover_files(args.directory):
+            queue.enqueue("ingest", {
+                "file_path": os.path.abspath(file_path),
+                "file_name": os.path.relpath(file_path, args.directory).replace(os.sep, "/"),
+            })
+            count += 1
+        print(f"{count} 件の取り込みジョブを投入しました。")
+    elif args.command == "status":
+        if args.job_id:
+            job = queue.get(args.job_id)
+            if job is None:
+                print("ジョブが見つかりません。")
+                return 1
+            for key, value in job.items():
+                print(f"{key}: {value}")
+        else:
+            for state, count in sorted(queue.stats().items()):
+                print(f"{state}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())